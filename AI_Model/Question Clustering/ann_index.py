@@ -0,0 +1,132 @@
+import os
+import json
+import numpy as np
+
+from cluster_state import l2_normalize
+
+DEFAULT_NPROBE = 16        # inverted lists scanned per query
+LISTS_PER_SQRT = 4         # nlist ~ 4 * sqrt(n)
+EXACT_BELOW = 5_000        # smaller corpora use a single list (exact search)
+TRAIN_PER_LIST = 64        # k-means training points per inverted list
+KMEANS_ITERATIONS = 5      # a few Lloyd steps give balanced lists; mini-batch k-means did not
+CHUNK_SIZE = 100_000       # rows per vectorized list-assignment chunk
+
+FILES = ("ivf_centroids.npy", "ivf_offsets.npy", "ivf_vectors.npy", "ivf_rows.npy", "ivf_items.json")
+
+
+class SimilarityIndex:
+    """
+    Inverted-file (IVF) nearest-neighbour index over L2-normalized question embeddings.
+
+    A k-means coarse quantizer splits the corpus into `nlist` lists; vectors are
+    stored contiguously sorted by list, so a query only scores the vectors of
+    its `nprobe` closest lists (a few contiguous slices) instead of the whole corpus.
+
+    Each indexed row is one unique question with all the ids it was asked under.
+    """
+
+    def __init__(self, centroids, offsets, vectors, rows, questions, ids):
+        self.centroids = centroids                     # (nlist, d) float32 list centres
+        self.sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        self.offsets = offsets                         # (nlist + 1,) list boundaries into vectors
+        self.vectors = vectors                         # (n, d) float32, sorted by list
+        self.rows = rows                               # (n,) item index of each sorted vector
+        self.questions = questions
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def build(cls, norm_embeddings, questions, ids, nlist=None, seed=42):
+        """norm_embeddings: (n, d) unit vectors; questions / ids: per-row text and id list."""
+        n = len(norm_embeddings)
+        if nlist is None:
+            nlist = 1 if n < EXACT_BELOW else int(LISTS_PER_SQRT * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        if nlist == 1:
+            centroids = np.zeros((1, norm_embeddings.shape[1]), dtype=np.float32)
+            assignment = np.zeros(n, dtype=np.int64)
+        else:
+            from sklearn.cluster import KMeans  # only needed to build, not to serve
+
+            rng = np.random.default_rng(seed)
+            train_size = min(n, nlist * TRAIN_PER_LIST)
+            train = np.sort(rng.choice(n, size=train_size, replace=False))
+            kmeans = KMeans(n_clusters=nlist, init="random", n_init=1, max_iter=KMEANS_ITERATIONS, random_state=seed)
+            kmeans.fit(np.asarray(norm_embeddings[train], dtype=np.float32))
+            centroids = kmeans.cluster_centers_.astype(np.float32)
+            sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+
+            assignment = np.empty(n, dtype=np.int64)
+            for start in range(0, n, CHUNK_SIZE):
+                block = np.asarray(norm_embeddings[start:start + CHUNK_SIZE], dtype=np.float32)
+                assignment[start:start + len(block)] = np.argmin(sq_norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+
+        rows = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+
+        vectors = np.empty((n, norm_embeddings.shape[1]), dtype=np.float32)
+        for start in range(0, n, CHUNK_SIZE):
+            vectors[start:start + CHUNK_SIZE] = norm_embeddings[rows[start:start + CHUNK_SIZE]]
+
+        print(f"Built similarity index over {n} questions ({nlist} lists).")
+        return cls(centroids, offsets, vectors, rows, list(questions), [list(i) for i in ids])
+
+    def search(self, query_embeddings, k=10, nprobe=DEFAULT_NPROBE):
+        """
+        Top-k most similar indexed questions for every query row.
+        Returns one list per query of {"question", "ids", "similarity"} (cosine), best first.
+        """
+        queries = l2_normalize(query_embeddings)
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        coarse = self.sq_norms[None, :] - 2.0 * (queries @ self.centroids.T)
+        probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for query, lists in zip(queries, probes):
+            spans = [(self.offsets[l], self.offsets[l + 1]) for l in lists if self.offsets[l + 1] > self.offsets[l]]
+            if not spans:
+                results.append([])
+                continue
+            positions = np.concatenate([np.arange(a, b) for a, b in spans])
+            scores = np.concatenate([self.vectors[a:b] @ query for a, b in spans])
+
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            results.append([
+                {
+                    "question": self.questions[row],
+                    "ids": self.ids[row],
+                    "similarity": float(scores[b])
+                }
+                for b, row in zip(best, self.rows[positions[best]])
+            ])
+        return results
+
+    def save(self, path):
+        np.save(os.path.join(path, "ivf_centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "ivf_offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "ivf_vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "ivf_rows.npy"), self.rows)
+        with open(os.path.join(path, "ivf_items.json"), "w") as f:
+            json.dump({"questions": self.questions, "ids": self.ids}, f, default=lambda value: value.item())
+
+    @classmethod
+    def load(cls, path):
+        """Loads a saved index with the vectors memory-mapped, or returns None if there is none."""
+        if not all(os.path.exists(os.path.join(path, name)) for name in FILES):
+            return None
+        with open(os.path.join(path, "ivf_items.json"), "r") as f:
+            items = json.load(f)
+        return cls(
+            np.load(os.path.join(path, "ivf_centroids.npy")),
+            np.load(os.path.join(path, "ivf_offsets.npy")),
+            np.load(os.path.join(path, "ivf_vectors.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "ivf_rows.npy"), mmap_mode="r"),
+            items["questions"],
+            items["ids"]
+        )
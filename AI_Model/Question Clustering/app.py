@@ -1,14 +1,22 @@
+import time
+STARTED_AT = time.perf_counter()  # startup time is measured from here
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
+import threading
 import uvicorn
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import euclidean_distances
-from sklearn.preprocessing import normalize
-import numpy as np
 
-# Import our clustering logic
-import clusters
+# Only lightweight modules are imported here. The model, and the clustering modules
+# (sklearn / pandas), are imported by the background loader so the server starts
+# answering /health immediately.
+from cluster_state import ClusterState
+from embedding_cache import EmbeddingCache
+from embedding_runner import encode_questions
+from online import OnlineClusterer
+from jobs import JobManager
+from state_store import StateStore
+from ann_index import DEFAULT_NPROBE
 
 app = FastAPI(title="Question Clustering API")
 
@@ -18,7 +26,16 @@ GLOBAL_STATE = {
     "model": None,
     "centroids": {},       # cluster_id -> vector (list)
     "cluster_map": {},     # cluster_id -> cluster_info
-    "is_model_loading": False
+    "cluster_state": ClusterState(),  # contiguous centroid matrix used for assignment
+    "embedding_cache": None,
+    "online": None,        # incremental assignment + background re-clustering
+    "jobs": JobManager(),  # asynchronous /cluster/jobs runs
+    "state_store": None,   # versioned snapshots on disk, shared by all workers
+    "state_version": None, # snapshot version this worker is serving
+    "is_model_loading": False,
+    "model_error": None,
+    "startup_seconds": None,    # import + startup until requests are accepted
+    "model_load_seconds": None  # background: clustering modules + model + cache
 }
 
 # --- Data Models ---
@@ -29,25 +46,146 @@ class QuestionItem(BaseModel):
 class ClusterRequest(BaseModel):
     ids: List[str]
     questions: List[str]
+    mode: Literal["auto", "exact", "scalable"] = "auto"  # "scalable" = sampled HDBSCAN; "auto" picks by corpus size
+
+class PartitionedClusterRequest(ClusterRequest):
+    partitions: List[str]  # e.g. the State of each question; each partition is clustered separately
 
 class PredictRequest(BaseModel):
     query: str
 
-# --- Startup Event ---
-@app.on_event("startup")
-def startup_event():
-    print("Starting up... Loading SentenceTransformer model in background...")
-    GLOBAL_STATE["is_model_loading"] = True
+class PredictBatchRequest(BaseModel):
+    queries: List[str]
+
+class SimilarRequest(BaseModel):
+    query: str
+    k: int = 10
+    nprobe: int = DEFAULT_NPROBE  # inverted lists scanned; higher = better recall, slower
+
+# --- Helpers ---
+def run_clustering(questions, ids, progress=None, mode="auto"):
+    import clusters
+    return clusters.get_clusters_with_representatives(
+        questions,
+        ids,
+        embed_model=GLOBAL_STATE["model"],
+        embedding_cache=GLOBAL_STATE["embedding_cache"],
+        progress=progress,
+        mode=mode
+    )
+
+def embed(questions):
+    return GLOBAL_STATE["embedding_cache"].get_or_encode(
+        questions, lambda qs: encode_questions(qs, GLOBAL_STATE["model"])
+    )
+
+def swap_in_results(results, state):
+    # Single reference assignments: readers see either the old or the new state
+    GLOBAL_STATE["cluster_state"] = state
+    GLOBAL_STATE["centroids"] = results["centroids"]
+    GLOBAL_STATE["cluster_map"] = results["cluster_map"]
+
+def save_snapshot(state, questions, ids):
+    GLOBAL_STATE["state_version"] = GLOBAL_STATE["state_store"].save(state, questions, ids)
+
+def publish_results(questions, ids, results):
+    # This run becomes the baseline for incremental ingest and the current snapshot for every worker
+    state = GLOBAL_STATE["online"].reset(questions, ids, results)
+    swap_in_results(results, state)
+    save_snapshot(state, questions, ids)
+    # The index now lives on the state; don't keep a second reference in stored job results
+    results.pop("similarity_index", None)
+    return state
+
+def on_background_swap(results, state):
+    # Called by OnlineClusterer (under its lock) once a background re-cluster is live
+    swap_in_results(results, state)
+    online = GLOBAL_STATE["online"]
+    save_snapshot(state, online.questions, online.ids)
+
+_sync_lock = threading.Lock()
+
+def sync_state():
+    """
+    Adopts the current on-disk snapshot if it differs from the one being served,
+    e.g. after a restart or when another worker has published a new clustering.
+    Costs one small file read when nothing changed.
+    """
+    store = GLOBAL_STATE["state_store"]
+    if store is None or store.current_version() in (None, GLOBAL_STATE["state_version"]):
+        return
+
+    with _sync_lock:
+        version = store.current_version()
+        if version in (None, GLOBAL_STATE["state_version"]):
+            return
+        try:
+            version, state, questions, ids = store.load(version)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Could not load cluster state v{version}: {e}")
+            return
+
+        # Keeps this worker's ingested-but-unpublished questions (see OnlineClusterer.adopt)
+        state = GLOBAL_STATE["online"].adopt(questions, ids, state)
+        swap_in_results({"centroids": state.centroid_map(), "cluster_map": state.cluster_map}, state)
+        GLOBAL_STATE["state_version"] = version
+        print(f"Loaded cluster state v{version} ({len(state)} clusters).")
+
+def load_model():
+    """Runs on a background thread: warm-start state, clustering modules, cache, then the model."""
+    started = time.perf_counter()
     try:
-        GLOBAL_STATE["model"] = SentenceTransformer('all-mpnet-base-v2')
-        print("Model loaded successfully!")
+        # Warm start: serve the last saved clustering without re-clustering
+        sync_state()
+
+        import clusters
+        from sentence_transformers import SentenceTransformer
+        GLOBAL_STATE["embedding_cache"] = EmbeddingCache(clusters.MODEL_NAME)
+        # Set last: a non-None model is what marks the service as ready
+        GLOBAL_STATE["model"] = SentenceTransformer(clusters.MODEL_NAME)
+        GLOBAL_STATE["model_load_seconds"] = round(time.perf_counter() - started, 3)
+        print(f"Model loaded successfully in {GLOBAL_STATE['model_load_seconds']}s!")
     except Exception as e:
+        GLOBAL_STATE["model_error"] = str(e)
         print(f"Failed to load model: {e}")
     finally:
         GLOBAL_STATE["is_model_loading"] = False
 
+# --- Startup Event ---
+@app.on_event("startup")
+def startup_event():
+    GLOBAL_STATE["state_store"] = StateStore()
+    GLOBAL_STATE["online"] = OnlineClusterer(run_clustering, on_swap=on_background_swap)
+
+    print("Starting up... Loading SentenceTransformer model in background...")
+    GLOBAL_STATE["is_model_loading"] = True
+    threading.Thread(target=load_model, name="model-loader", daemon=True).start()
+
+    GLOBAL_STATE["startup_seconds"] = round(time.perf_counter() - STARTED_AT, 3)
+    print(f"Accepting requests after {GLOBAL_STATE['startup_seconds']}s.")
+
 # --- Endpoints ---
 
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving requests (the model may still be loading)."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once the model is loaded, 503 while loading or after a failed load."""
+    if GLOBAL_STATE["model"] is None:
+        status = "loading" if GLOBAL_STATE["is_model_loading"] else "failed"
+        raise HTTPException(status_code=503, detail={"status": status, "error": GLOBAL_STATE["model_error"]})
+
+    return {
+        "status": "ready",
+        "startup_seconds": GLOBAL_STATE["startup_seconds"],
+        "model_load_seconds": GLOBAL_STATE["model_load_seconds"],
+        "state_version": GLOBAL_STATE["state_version"],
+        "clusters": len(GLOBAL_STATE["cluster_state"])
+    }
+
 @app.post("/cluster")
 def perform_clustering(request: ClusterRequest):
     if GLOBAL_STATE["model"] is None:
@@ -64,18 +202,13 @@ def perform_clustering(request: ClusterRequest):
     # Call the logic from clusters.py
     # Returns: { "report": ..., "centroids": ..., "cluster_map": ... }
     try:
-        results = clusters.get_clusters_with_representatives(
-            questions, 
-            ids, 
-            embed_model=GLOBAL_STATE["model"]
-        )
+        results = run_clustering(questions, ids, mode=request.mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Update Global State
-    GLOBAL_STATE["centroids"] = results["centroids"]
-    GLOBAL_STATE["cluster_map"] = results["cluster_map"]
-    
+    # Update Global State and persist it as the new current snapshot
+    publish_results(questions, ids, results)
+
     print(f"Clustering done. Stored {len(GLOBAL_STATE['centroids'])} centroids.")
 
     return {
@@ -83,45 +216,168 @@ def perform_clustering(request: ClusterRequest):
         "centroids": results["centroids"]
     }
 
+@app.post("/cluster/partitioned")
+def perform_partitioned_clustering(request: PartitionedClusterRequest):
+    """
+    Clusters every partition (e.g. State) on its own, concurrently in worker processes,
+    and returns per-partition clusters plus global themes. Does not replace the
+    clusters /predict serves.
+    """
+    if GLOBAL_STATE["model"] is None:
+        raise HTTPException(status_code=503, detail="Model is still loading or failed to load.")
+
+    if not (len(request.questions) == len(request.ids) == len(request.partitions)):
+        raise HTTPException(status_code=400, detail="Length of questions, ids and partitions must match.")
+
+    import partitioned
+    try:
+        results = partitioned.get_partitioned_clusters(
+            request.questions, request.ids, request.partitions,
+            embed_model=GLOBAL_STATE["model"],
+            embedding_cache=GLOBAL_STATE["embedding_cache"],
+            mode=request.mode
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "partitions": {
+            name: {"questions": partition["questions"], "clusters": partition["report"]}
+            for name, partition in results["partitions"].items()
+        },
+        "rollup": results["rollup"],
+        "seconds": results["seconds"]
+    }
+
+@app.post("/cluster/jobs")
+def submit_clustering_job(request: ClusterRequest):
+    """
+    Queues a clustering run and returns immediately with a job id.
+    /predict keeps answering from the current clusters until the job completes.
+    """
+    if GLOBAL_STATE["model"] is None:
+        raise HTTPException(status_code=503, detail="Model is still loading or failed to load.")
+
+    if len(request.questions) != len(request.ids):
+        raise HTTPException(status_code=400, detail="Length of questions and ids must match.")
+
+    questions = list(request.questions)
+    ids = list(request.ids)
+
+    def publish(results):
+        state = publish_results(questions, ids, results)
+        print(f"Clustering job done. Stored {len(state)} centroids.")
+
+    job_id = GLOBAL_STATE["jobs"].submit(run_clustering, questions, ids, mode=request.mode, on_done=publish)
+    print(f"Queued clustering job {job_id} for {len(questions)} items.")
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/cluster/jobs/{job_id}")
+def clustering_job_status(job_id: str):
+    status = GLOBAL_STATE["jobs"].status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return status
+
+@app.get("/cluster/jobs/{job_id}/result")
+def clustering_job_result(job_id: str):
+    job = GLOBAL_STATE["jobs"].result(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}.")
+
+    return {
+        "clusters": job["result"]["report"],
+        "centroids": job["result"]["centroids"]
+    }
+
 @app.post("/predict")
 def predict_cluster(request: PredictRequest):
     if GLOBAL_STATE["model"] is None:
          raise HTTPException(status_code=503, detail="Model is loading.")
     
-    if not GLOBAL_STATE["centroids"]:
+    sync_state()
+    state = GLOBAL_STATE["cluster_state"]
+    if not len(state):
         raise HTTPException(status_code=400, detail="No clusters found. Please call /cluster first.")
 
     # 1. Encode query
     query_embedding = GLOBAL_STATE["model"].encode([request.query])
-    norm_query = normalize(query_embedding, norm='l2')
 
-    # 2. Compare with centroids
-    best_cluster_id = -1
-    min_dist = float('inf')
-    
-    # Threshold for "noise" - purely heuristic. 
-    # If distance > 0.8 (example), might be unrelated. Set high to always assign.
-    NOISE_THRESHOLD = 1.0 
-
-    for cid, centroid_list in GLOBAL_STATE["centroids"].items():
-        centroid_vec = np.array(centroid_list).reshape(1, -1)
-        dist = euclidean_distances(norm_query, centroid_vec)[0][0]
-        
-        if dist < min_dist:
-            min_dist = dist
-            best_cluster_id = cid
+    # 2. Compare with all centroids in one matrix product
+    cluster_ids, distances = state.assign(query_embedding)
 
     # 3. determine result
-    if min_dist > NOISE_THRESHOLD:
-        return {"cluster_id": -1, "distance": min_dist, "note": "Too far from any cluster"}
-    
-    # Retrieve cluster info
-    cluster_info = GLOBAL_STATE["cluster_map"].get(best_cluster_id)
-    
+    return state.describe(cluster_ids[0], distances[0])
+
+@app.post("/predict/batch")
+def predict_cluster_batch(request: PredictBatchRequest):
+    if GLOBAL_STATE["model"] is None:
+         raise HTTPException(status_code=503, detail="Model is loading.")
+
+    sync_state()
+    state = GLOBAL_STATE["cluster_state"]
+    if not len(state):
+        raise HTTPException(status_code=400, detail="No clusters found. Please call /cluster first.")
+
+    if not request.queries:
+        return {"predictions": []}
+
+    # One encoder pass for all queries, one matrix product for all assignments
+    query_embeddings = encode_questions(request.queries, GLOBAL_STATE["model"])
+    cluster_ids, distances = state.assign(query_embeddings)
+
+    return {
+        "predictions": [
+            {"query": query, **state.describe(cid, dist)}
+            for query, cid, dist in zip(request.queries, cluster_ids, distances)
+        ]
+    }
+
+@app.post("/similar")
+def similar_questions(request: SimilarRequest):
+    """Top-k most similar previously clustered questions, with all their ids."""
+    if GLOBAL_STATE["model"] is None:
+         raise HTTPException(status_code=503, detail="Model is loading.")
+
+    if request.k < 1 or request.nprobe < 1:
+        raise HTTPException(status_code=400, detail="k and nprobe must be positive.")
+
+    sync_state()
+    index = GLOBAL_STATE["cluster_state"].similarity_index
+    if index is None or not len(index):
+        raise HTTPException(status_code=400, detail="No similarity index found. Please call /cluster first.")
+
+    query_embedding = GLOBAL_STATE["model"].encode([request.query])
+    return {"matches": index.search(query_embedding, k=request.k, nprobe=request.nprobe)[0]}
+
+@app.post("/ingest")
+def ingest_questions(request: ClusterRequest):
+    """
+    Assigns new questions to existing clusters (or the pending-noise pool) right away.
+    A full re-cluster runs in the background once the noise pool or drift grows too large.
+    """
+    if GLOBAL_STATE["model"] is None:
+        raise HTTPException(status_code=503, detail="Model is loading.")
+
+    if len(request.questions) != len(request.ids):
+        raise HTTPException(status_code=400, detail="Length of questions and ids must match.")
+
+    sync_state()
+    online = GLOBAL_STATE["online"]
+    if not request.questions:
+        assignments = []
+    else:
+        assignments = online.ingest(request.questions, request.ids, embed(request.questions))
+
     return {
-        "cluster_id": best_cluster_id,
-        "representative_question": cluster_info["representative_question"] if cluster_info else None,
-        "distance": min_dist
+        "assignments": assignments,
+        "noise_pool": len(online.noise_pool),
+        "max_drift": online.max_drift,
+        "reclustering": online.is_reclustering
     }
 
 if __name__ == "__main__":
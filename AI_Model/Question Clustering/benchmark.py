@@ -0,0 +1,344 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+EMBEDDING_DIM = 768  # all-mpnet-base-v2
+SEED_CSV = "pm_ajay_final_simulated_data.csv"
+
+# Synthetic expansions of the simulated doubts: same intents, varied wording
+PREFIXES = ["", "Sir, ", "Please tell me: ", "Urgent - ", "Hello, ", "Kindly help, ", "Query: "]
+SUFFIXES = ["", " Please help.", " It has been two months.", " Nobody at the office knows.",
+            " I applied last year.", " My village sarpanch also asked."]
+
+
+def synthetic_corpus(size, seed=0, path=SEED_CSV):
+    """
+    `size` grievance texts seeded from the simulated data: each combines a real doubt,
+    its raised issue and location with random prefixes/suffixes, so the corpus keeps
+    the original intents while containing many distinct wordings.
+    """
+    data = pd.read_csv(path, skipinitialspace=True)
+    data.columns = data.columns.str.strip()
+    rows = data[["Doubt", "Issue_Raised", "District", "State"]].astype(str).apply(lambda col: col.str.strip())
+
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(rows), size=size)
+    prefixes = rng.integers(0, len(PREFIXES), size=size)
+    suffixes = rng.integers(0, len(SUFFIXES), size=size)
+    with_issue = rng.random(size) < 0.5
+    values = rows.to_numpy()
+    return [
+        f"{PREFIXES[p]}{values[r, 0]}"
+        + (f" ({values[r, 1]} in {values[r, 2]}, {values[r, 3]})" if issue else "")
+        + SUFFIXES[s]
+        for r, p, s, issue in zip(picks, prefixes, suffixes, with_issue)
+    ]
+
+
+class StubEncoder:
+    """
+    Model-free stand-in for SentenceTransformer: a fixed random projection of each
+    text's word counts. Texts sharing words get similar vectors, so clustering sees
+    realistic structure, and no model download is needed.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, seed=0):
+        self.dim = dim
+        self.seed = seed
+        self.tokenizer = None
+        self._vocab = {}
+        self._projection = np.empty((0, dim), dtype=np.float32)
+
+    def get_max_seq_length(self):
+        return 384
+
+    def _word_vectors(self, n_words):
+        missing = n_words - len(self._projection)
+        if missing > 0:
+            rng = np.random.default_rng([self.seed, len(self._projection)])
+            self._projection = np.vstack([self._projection, rng.normal(size=(missing, self.dim)).astype(np.float32)])
+        return self._projection
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        rows, cols = [], []
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", str(text).lower()):
+                rows.append(i)
+                cols.append(self._vocab.setdefault(word, len(self._vocab)))
+        counts = csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                            shape=(len(texts), len(self._vocab)))
+        vectors = np.asarray(counts @ self._word_vectors(len(self._vocab)), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def synthetic_embeddings(path, size, dim=EMBEDDING_DIM, n_topics=200, seed=0, chunk_size=100_000):
+    """
+    Writes a (size, dim) float32 memmap of unit vectors drawn around `n_topics` centres,
+    so the clustering step sees realistic, well separated topic structure.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_topics, dim)).astype(np.float32)
+    matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(size, dim))
+    for i in range(0, size, chunk_size):
+        n = min(chunk_size, size - i)
+        block = centres[rng.integers(0, n_topics, size=n)] + rng.normal(scale=0.6, size=(n, dim)).astype(np.float32)
+        matrix[i:i + n] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    matrix.flush()
+    return path
+
+
+def _scaling_run(mode, path):
+    """One (mode, size) measurement, run in its own process so peak RSS is per run."""
+    import clusters
+
+    embeddings = np.load(path, mmap_mode="r")
+    n = len(embeddings)
+    df = pd.DataFrame({
+        "Questions": [f"question {i}" for i in range(n)],
+        "ids": [[i] for i in range(n)],
+        "weight": np.ones(n, dtype=np.int64)
+    })
+
+    start = time.perf_counter()
+    results = clusters.cluster_from_embeddings(df, embeddings, mode=mode, similarity_index=False)
+    wall = time.perf_counter() - start
+
+    clustered = sum(c["count"] for c in results["report"])
+    print(json.dumps({
+        "mode": mode,
+        "questions": n,
+        "wall_seconds": round(wall, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "clusters": len(results["report"]),
+        "clustered_fraction": round(clustered / n, 3)
+    }))
+
+
+def scaling_curves(sizes, modes, exact_max, output, timeout):
+    """Wall time and peak memory of exact vs scalable clustering across corpus sizes."""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = synthetic_embeddings(os.path.join(tmp, f"emb_{size}.npy"), size)
+            for mode in modes:
+                if mode == "exact" and size > exact_max:
+                    rows.append({"mode": mode, "questions": size, "skipped": f"above --exact-max {exact_max}"})
+                    print(rows[-1])
+                    continue
+                try:
+                    proc = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "_scaling-run", mode, path],
+                        capture_output=True, text=True, timeout=timeout, check=True
+                    )
+                    rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+                except subprocess.TimeoutExpired:
+                    rows.append({"mode": mode, "questions": size, "skipped": f"timeout after {timeout}s"})
+                except subprocess.CalledProcessError as e:
+                    rows.append({"mode": mode, "questions": size, "error": e.stderr.strip().splitlines()[-1]})
+                print(rows[-1])
+            os.remove(path)
+
+    with open(output, "w") as f:
+        json.dump(rows, f, indent=2)
+    print(f"Wrote {len(rows)} measurements to {output}")
+    return rows
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 4)
+
+
+def _latency_stats(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "requests": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3)
+    }
+
+
+def predict_latency(encoder, results, queries):
+    """End-to-end /predict latency through the FastAPI app, against the given clustering."""
+    from fastapi.testclient import TestClient
+    import app
+    from cluster_state import ClusterState
+
+    # No `with`: startup (background model load, snapshot sync) is skipped on purpose
+    app.GLOBAL_STATE["model"] = encoder
+    app.GLOBAL_STATE["cluster_state"] = ClusterState.from_results(results)
+    client = TestClient(app.app)
+    client.post("/predict", json={"query": queries[0]}).raise_for_status()  # warm-up
+
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        client.post("/predict", json={"query": query}).raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return _latency_stats(samples)
+
+
+def pipeline_run(size, encoder, mode="auto", predict_requests=200, seed=0):
+    """Times every clustering stage separately for one synthetic corpus size."""
+    import clusters
+    from cluster_state import l2_normalize
+    from embedding_runner import encode_questions
+    from ann_index import SimilarityIndex
+
+    texts = synthetic_corpus(size, seed)
+    df, collapse_s = _timed(clusters.collapse_questions, texts, [str(i) for i in range(size)])
+    unique = df["Questions"].tolist()
+    weights = df["weight"].to_numpy()
+
+    embeddings, embed_s = _timed(encode_questions, unique, encoder, log_every=10**9)
+    norm_embeddings = l2_normalize(embeddings)
+
+    if mode == "auto":
+        mode = "scalable" if len(df) > clusters.AUTO_SCALABLE_ABOVE else "exact"
+    if mode == "scalable":
+        labels, cluster_s = _timed(clusters.cluster_scalable, norm_embeddings, weights)
+    else:
+        labels, cluster_s = _timed(clusters._hdbscan_weighted, norm_embeddings, weights,
+                                   clusters.MIN_CLUSTER_SIZE, clusters.MIN_SAMPLES)
+    df["cluster"] = labels
+    results, summarize_s = _timed(clusters.summarize_clusters, df, norm_embeddings, labels)
+    _, index_s = _timed(SimilarityIndex.build, norm_embeddings, df["Questions"], df["ids"])
+
+    clustered = sum(c["count"] for c in results["report"])
+    row = {
+        "questions": size,
+        "unique_questions": len(df),
+        "collapse": {"seconds": collapse_s},
+        "embedding": {"seconds": embed_s, "questions_per_second": round(len(df) / max(embed_s, 1e-9), 1)},
+        "clustering": {"seconds": cluster_s, "mode": mode, "clusters": len(results["report"]),
+                       "clustered_fraction": round(clustered / size, 3)},
+        "representatives": {"seconds": summarize_s},
+        "similarity_index": {"seconds": index_s},
+    }
+    if results["report"] and predict_requests:
+        row["predict"] = predict_latency(encoder, results, synthetic_corpus(predict_requests, seed + 1))
+    else:
+        row["predict"] = {"skipped": "no clusters"}
+    return row
+
+
+def _environment(encoder_name):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "."], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+
+    import sklearn
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "encoder": encoder_name,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+
+def pipeline_suite(sizes, encoder_name, mode, predict_requests, output, seed=0):
+    """Stage-by-stage timings across corpus sizes, written as one JSON report."""
+    if encoder_name == "stub":
+        encoder = StubEncoder()
+    else:
+        from sentence_transformers import SentenceTransformer
+        from clusters import MODEL_NAME
+        encoder = SentenceTransformer(MODEL_NAME)
+
+    report = {"environment": _environment(encoder_name), "runs": []}
+    for size in sizes:
+        row = pipeline_run(size, encoder, mode=mode, predict_requests=predict_requests, seed=seed)
+        report["runs"].append(row)
+        print(json.dumps(row))
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote pipeline report for {len(sizes)} sizes to {output}")
+    return report
+
+
+STAGES = ("collapse", "embedding", "clustering", "representatives", "similarity_index")
+
+
+def compare_reports(old_path, new_path):
+    """Per-size, per-stage seconds (and /predict p50) of two pipeline reports, new vs old."""
+    with open(old_path, "r") as f:
+        old = json.load(f)
+    with open(new_path, "r") as f:
+        new = json.load(f)
+    print(f"old: {old['environment'].get('commit')}  new: {new['environment'].get('commit')}")
+
+    old_runs = {run["questions"]: run for run in old["runs"]}
+    for run in new["runs"]:
+        before = old_runs.get(run["questions"])
+        if before is None:
+            continue
+        print(f"-- {run['questions']} questions")
+        pairs = [(stage, before[stage]["seconds"], run[stage]["seconds"]) for stage in STAGES]
+        if "p50_ms" in before["predict"] and "p50_ms" in run["predict"]:
+            pairs.append(("predict p50 (ms)", before["predict"]["p50_ms"], run["predict"]["p50_ms"]))
+        for name, a, b in pairs:
+            change = f"{100.0 * (b - a) / a:+.1f}%" if a else "n/a"
+            print(f"   {name:<18} {a:>10.4f} -> {b:>10.4f}  {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Question clustering benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scaling = commands.add_parser("scaling", help="Exact vs scalable clustering: wall time and peak memory")
+    scaling.add_argument("--sizes", default="10000,50000,100000,250000,500000,1000000,2000000")
+    scaling.add_argument("--modes", default="exact,scalable")
+    scaling.add_argument("--exact-max", type=int, default=100_000,
+                         help="Skip exact mode above this many questions")
+    scaling.add_argument("--timeout", type=int, default=3600, help="Seconds per run")
+    scaling.add_argument("--output", default="scaling_benchmark.json")
+
+    pipeline = commands.add_parser("pipeline", help="Per-stage timings: embedding, HDBSCAN, representatives, /predict")
+    pipeline.add_argument("--sizes", default="1000,5000,10000")
+    pipeline.add_argument("--encoder", choices=["stub", "model"], default="stub",
+                          help="stub = model-free random-projection encoder (no download)")
+    pipeline.add_argument("--mode", default="auto", choices=["auto", "exact", "scalable"])
+    pipeline.add_argument("--predict-requests", type=int, default=200)
+    pipeline.add_argument("--seed", type=int, default=0)
+    pipeline.add_argument("--output", default="pipeline_benchmark.json")
+
+    compare = commands.add_parser("compare", help="Compare two pipeline reports (e.g. from two commits)")
+    compare.add_argument("old")
+    compare.add_argument("new")
+
+    run = commands.add_parser("_scaling-run")
+    run.add_argument("mode")
+    run.add_argument("path")
+
+    args = parser.parse_args()
+    if args.command == "scaling":
+        scaling_curves([int(s) for s in args.sizes.split(",")], args.modes.split(","),
+                       args.exact_max, args.output, args.timeout)
+    elif args.command == "pipeline":
+        pipeline_suite([int(s) for s in args.sizes.split(",")], args.encoder, args.mode,
+                       args.predict_requests, args.output, args.seed)
+    elif args.command == "compare":
+        compare_reports(args.old, args.new)
+    elif args.command == "_scaling-run":
+        _scaling_run(args.mode, args.path)
@@ -0,0 +1,118 @@
+import threading
+import numpy as np
+
+# Threshold for "noise" - purely heuristic.
+# If distance > 0.8 (example), might be unrelated. Set high to always assign.
+NOISE_THRESHOLD = 1.0
+
+
+def l2_normalize(vectors):
+    """Row-wise L2 normalization (sklearn's normalize without importing sklearn on the serving path)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class ClusterState:
+    """
+    Serving-side view of one clustering result.
+
+    Centroids are held as a single contiguous float32 matrix (row i <-> cluster_ids[i])
+    with their squared norms precomputed, so assigning any number of L2-normalized
+    queries is one matrix product:  |q - c|^2 = 1 + |c|^2 - 2 q.c
+    """
+
+    def __init__(self, centroid_map=None, cluster_map=None):
+        centroid_map = centroid_map or {}
+        cluster_ids = np.array([int(cid) for cid in centroid_map], dtype=np.int64)
+        if len(cluster_ids):
+            centroids = np.array(list(centroid_map.values()), dtype=np.float32)
+        else:
+            centroids = np.empty((0, 0), dtype=np.float32)
+        self._set_arrays(cluster_ids, centroids, cluster_map)
+
+    def _set_arrays(self, cluster_ids, centroids, cluster_map):
+        self.cluster_map = {int(cid): info for cid, info in (cluster_map or {}).items()}
+        self.cluster_ids = np.asarray(cluster_ids, dtype=np.int64)
+        self.rows = {int(cid): row for row, cid in enumerate(self.cluster_ids)}
+
+        # Stays a memmap when one is passed in (already contiguous float32)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+
+        # Online updates: running member counts and the centroids as first clustered
+        self.counts = np.array(
+            [self.cluster_map.get(int(cid), {}).get("count", 1) for cid in self.cluster_ids],
+            dtype=np.int64
+        )
+        self.baseline = np.array(self.centroids)
+        self.similarity_index = None   # SimilarityIndex over the clustered questions, if built
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_results(cls, results):
+        """Builds the state from get_clusters_with_representatives output."""
+        state = cls(results["centroids"], results["cluster_map"])
+        state.similarity_index = results.get("similarity_index")
+        return state
+
+    @classmethod
+    def from_arrays(cls, cluster_ids, centroids, cluster_map, similarity_index=None):
+        """Builds the state from a saved snapshot (centroids may be a memory-mapped array)."""
+        state = cls.__new__(cls)
+        state._set_arrays(cluster_ids, centroids, cluster_map)
+        state.similarity_index = similarity_index
+        return state
+
+    def centroid_map(self):
+        """cluster_id -> centroid as a list, the shape /cluster responses use."""
+        with self._lock:
+            return {int(cid): row.tolist() for cid, row in zip(self.cluster_ids, self.centroids)}
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    def assign(self, query_embeddings):
+        """
+        Nearest centroid for every query row.
+        Returns (cluster_ids, distances) as arrays aligned with the queries.
+        """
+        queries = l2_normalize(query_embeddings)
+        with self._lock:
+            sq_dist = 1.0 + self.sq_norms[None, :] - 2.0 * (queries @ self.centroids.T)
+        best = np.argmin(sq_dist, axis=1)
+        distances = np.sqrt(np.maximum(sq_dist[np.arange(len(queries)), best], 0.0))
+        return self.cluster_ids[best], distances
+
+    def add_member(self, cluster_id, embedding, question_id):
+        """
+        Folds one new question into a cluster with a running-mean centroid update.
+        Returns how far that centroid has now moved from where clustering put it.
+        """
+        vector = l2_normalize(np.reshape(embedding, (1, -1)))[0]
+        row = self.rows[int(cluster_id)]
+
+        with self._lock:
+            self.counts[row] += 1
+            self.centroids[row] += (vector - self.centroids[row]) / self.counts[row]
+            self.sq_norms[row] = float(self.centroids[row] @ self.centroids[row])
+
+            cluster_info = self.cluster_map.get(int(cluster_id))
+            if cluster_info is not None:
+                cluster_info["question_ids"].append(question_id)
+                cluster_info["count"] = int(self.counts[row])
+
+            return float(np.linalg.norm(self.centroids[row] - self.baseline[row]))
+
+    def describe(self, cluster_id, distance):
+        """API response for one assignment, matching the original /predict shape."""
+        cluster_id, distance = int(cluster_id), float(distance)
+        if distance > NOISE_THRESHOLD:
+            return {"cluster_id": -1, "distance": distance, "note": "Too far from any cluster"}
+
+        cluster_info = self.cluster_map.get(cluster_id)
+        return {
+            "cluster_id": cluster_id,
+            "representative_question": cluster_info["representative_question"] if cluster_info else None,
+            "distance": distance
+        }
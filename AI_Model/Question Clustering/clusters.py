@@ -1,94 +1,219 @@
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
 from sklearn.cluster import HDBSCAN
+from sklearn.decomposition import PCA
 from sklearn.preprocessing import normalize
-from sklearn.metrics.pairwise import euclidean_distances
-
-df = pd.read_csv('processed_issues_uuid.csv')
-# if 'id' not in df.columns:
-#     df['id'] = range(1, len(df) + 1)
-df2 = pd.read_csv("pm_ajay_final_simulated_data.csv")
-df2.columns = df2.columns.str.strip()
-for col in df2.select_dtypes(include=['object']).columns:
-    df2[col] = df2[col].str.strip()
-df2['id'] = range(1, len(df2) + 1)
-# df2["questions"] = df2["Doubt"].astype(str) + " " + df2["Issue_Raised"].astype(str)
-df2["questions"] = df2["Doubt"]
-def get_clusters_with_representatives(questions, ids, embed_model=None):
-
-    df = pd.DataFrame({
+from scipy.sparse import csr_matrix
+
+from embedding_cache import normalize_question
+from embedding_runner import encode_questions
+from ann_index import SimilarityIndex
+
+MODEL_NAME = 'all-mpnet-base-v2'
+MIN_CLUSTER_SIZE = 30
+MIN_SAMPLES = 10
+
+# Scalable mode
+AUTO_SCALABLE_ABOVE = 100_000   # unique questions; exact HDBSCAN gets impractical beyond this
+SCALABLE_SAMPLE_SIZE = 50_000   # points HDBSCAN actually sees in scalable mode
+SCALABLE_DIMENSIONS = 64        # PCA components used for clustering and assignment
+CHUNK_SIZE = 100_000            # rows per vectorized assignment / distance chunk
+
+def collapse_questions(questions, ids, near_duplicates=False, near_threshold=0.8):
+    """
+    Collapses repeated questions into weighted unique items.
+
+    Exact and whitespace/case-normalized duplicates always collapse; with
+    `near_duplicates=True`, near-identical wordings (character n-gram MinHash)
+    collapse too. The first wording seen is kept as the item's text.
+
+    Returns a DataFrame with one row per unique item:
+    Questions, ids (all original ids), weight (number of original rows).
+    """
+    rows = pd.DataFrame({
         "Questions": list(questions),
         "id": list(ids)
     })
+    rows["key"] = [normalize_question(q) for q in rows["Questions"]]
 
-    print(f"Prepared {len(df)} questions for embedding.")
+    if near_duplicates:
+        from dedup import group_near_duplicates
+        unique_keys = rows["key"].drop_duplicates()
+        labels = group_near_duplicates(unique_keys.tolist(), threshold=near_threshold)
+        rows["key"] = rows["key"].map(dict(zip(unique_keys, labels)))
 
-    if embed_model:
-        embed_function = embed_model
-    else:
-        print("Loading SentenceTransformer model...")
-        embed_function = SentenceTransformer('all-mpnet-base-v2')
-        
-    all_embeddings = []
-    batch_size = 25
+    grouped = rows.groupby("key", sort=False)
+    return pd.DataFrame({
+        "Questions": grouped["Questions"].first().tolist(),
+        "ids": grouped["id"].apply(list).tolist(),
+        "weight": grouped.size().to_numpy()
+    })
+
+def get_clusters_with_representatives(questions, ids, embed_model=None, embedding_cache=None,
+                                      near_duplicates=False, encode_pool=None, progress=None,
+                                      mode="auto", similarity_index=True):
+
+    # Optional progress(phase, done, total) hook, used by background clustering jobs
+    report_progress = progress or (lambda phase, done, total: None)
+
+    # Embedding cost scales with distinct questions: repeats are collapsed up front
+    df = collapse_questions(questions, ids, near_duplicates=near_duplicates)
+    weights = df["weight"].to_numpy()
+
+    print(f"Prepared {len(df)} unique questions (from {weights.sum()} rows) for embedding.")
+
+    embed_function = embed_model
     
+    def encode(qs):
+        # Loaded lazily: a fully cached run never needs the model
+        nonlocal embed_function
+        if embed_function is None:
+            from sentence_transformers import SentenceTransformer
+            print("Loading SentenceTransformer model...")
+            embed_function = SentenceTransformer(MODEL_NAME)
+
+        # Length-bucketed, token-budgeted batches instead of fixed batches of 25
+        return encode_questions(qs, embed_function, pool=encode_pool,
+                                progress=lambda done, total: report_progress("embedding", done, total))
+
     # Use the list of questions from the internal dataframe
     qs = df["Questions"].tolist()
-    
-    for i in range(0, len(qs), batch_size):
-        batch_questions = qs[i:i + batch_size]
-        batch_embeddings = embed_function.encode(batch_questions)
-        all_embeddings.extend(batch_embeddings)
-        print(f"Processed batch {i // batch_size + 1}/{(len(qs) + batch_size - 1) // batch_size}")
 
-    norm_embeddings = normalize(all_embeddings, norm='l2')
+    report_progress("embedding", 0, len(qs))
 
-    print("Clustering with HDBSCAN...")
-    clusterer = HDBSCAN(min_cluster_size=30, min_samples=10  , metric='euclidean')
-    df['cluster'] = clusterer.fit_predict(norm_embeddings)
-    print(f"Clustering complete. Found {len(set(df['cluster']))} clusters (including noise).")
+    # With a cache, only questions never seen before (for this model) reach the encoder
+    if embedding_cache is not None:
+        all_embeddings = embedding_cache.get_or_encode(qs, encode)
+    else:
+        all_embeddings = encode(qs)
 
-    output_report = []
-    
-    # Iterate over unique clusters (excluding -1 which is noise)
-    unique_labels = set(df['cluster'])
-    if -1 in unique_labels:
-        unique_labels.remove(-1)
+    norm_embeddings = normalize(np.asarray(all_embeddings, dtype=np.float32), norm='l2')
+    report_progress("embedding", len(qs), len(qs))
+
+    return cluster_from_embeddings(df, norm_embeddings, mode=mode, progress=progress,
+                                   similarity_index=similarity_index)
+
+def _hdbscan_weighted(vectors, weights, min_cluster_size, min_samples):
+    # sklearn's HDBSCAN has no sample weights. A unique item with weight w is fed in
+    # min(w, min_cluster_size) times: identical points always share a label, a heavily
+    # repeated question can still form a cluster on its own, and HDBSCAN's input
+    # stays bounded by the number of distinct questions.
+    repeats = np.minimum(weights, min_cluster_size)
+    weighted_vectors = np.repeat(vectors, repeats, axis=0)
+    first_copy = np.concatenate(([0], np.cumsum(repeats)[:-1]))
+
+    clusterer = HDBSCAN(min_cluster_size=min_cluster_size, min_samples=min_samples, metric='euclidean')
+    return clusterer.fit_predict(weighted_vectors)[first_copy]
+
+def _grouped_means(vectors, rows, group, weights, n_groups):
+    """
+    Weighted mean of vectors[rows] per group in one sparse matrix product.
+    `vectors` is never copied, so it can be a memory-mapped matrix.
+    """
+    members = csr_matrix(
+        (weights.astype(np.float32), (group, rows)), shape=(n_groups, len(vectors))
+    )
+    sums = np.asarray(members @ vectors, dtype=np.float64)
+    return (sums / np.asarray(members.sum(axis=1))).astype(np.float32)
 
+def _distances_to_own_centroid(vectors, rows, group, centroids, chunk_size=CHUNK_SIZE):
+    """|x - c_group| for every vectors[rows], in chunks so no (n, d) temporary is built."""
+    distances = np.empty(len(rows), dtype=np.float32)
+    for i in range(0, len(rows), chunk_size):
+        diff = vectors[rows[i:i + chunk_size]] - centroids[group[i:i + chunk_size]]
+        distances[i:i + chunk_size] = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+    return distances
+
+def cluster_scalable(norm_embeddings, weights, sample_size=SCALABLE_SAMPLE_SIZE,
+                     n_components=SCALABLE_DIMENSIONS, chunk_size=CHUNK_SIZE,
+                     min_cluster_size=MIN_CLUSTER_SIZE, min_samples=MIN_SAMPLES):
+    """
+    Approximate HDBSCAN for very large corpora.
+
+    1. PCA (fit on a sample) reduces the embeddings to `n_components` dimensions.
+    2. HDBSCAN runs on a uniform sample only, with cluster sizes scaled to the sample.
+    3. Every other point joins its nearest sample centroid (one matrix product per
+       chunk) if it lies within that cluster's 95th percentile radius; else it is noise.
+    """
+    n = len(norm_embeddings)
+    rng = np.random.default_rng(0)
+    sample_idx = np.sort(rng.choice(n, size=min(n, sample_size), replace=False))
+    fraction = len(sample_idx) / n
+
+    pca = PCA(n_components=min(n_components, norm_embeddings.shape[1], len(sample_idx)),
+              svd_solver='randomized', random_state=0)
+    sample_reduced = normalize(pca.fit_transform(norm_embeddings[sample_idx]), norm='l2').astype(np.float32)
+
+    min_cluster_size = max(5, round(min_cluster_size * fraction))
+    min_samples = max(2, min(min_cluster_size, round(min_samples * fraction)))
+    print(f"Scalable mode: HDBSCAN on {len(sample_idx)} of {n} points in {pca.n_components_} dims "
+          f"(min_cluster_size={min_cluster_size}).")
+    sample_labels = _hdbscan_weighted(sample_reduced, weights[sample_idx], min_cluster_size, min_samples)
+
+    labels = np.full(n, -1, dtype=np.int64)
+    clustered = sample_labels >= 0
+    if not clustered.any():
+        return labels
+
+    sample_rows = np.flatnonzero(clustered)
+    cluster_ids, group = np.unique(sample_labels[sample_rows], return_inverse=True)
+    centroids = _grouped_means(sample_reduced, sample_rows, group, weights[sample_idx][sample_rows], len(cluster_ids))
+    radii = pd.Series(
+        _distances_to_own_centroid(sample_reduced, sample_rows, group, centroids)
+    ).groupby(group).quantile(0.95).to_numpy()
+    sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+
+    for i in range(0, n, chunk_size):
+        reduced = normalize(pca.transform(norm_embeddings[i:i + chunk_size]), norm='l2')
+        sq_dist = 1.0 + sq_norms[None, :] - 2.0 * (reduced @ centroids.T)
+        best = np.argmin(sq_dist, axis=1)
+        dist = np.sqrt(np.maximum(sq_dist[np.arange(len(best)), best], 0.0))
+        labels[i:i + chunk_size] = np.where(dist <= radii[best], cluster_ids[best], -1)
+
+    # Sampled points keep the label HDBSCAN gave them
+    labels[sample_idx] = sample_labels
+    return labels
+
+def summarize_clusters(df, norm_embeddings, labels):
+    """
+    Centroids, representatives and member ids for every cluster in one grouped pass
+    (no per-label masking): weighted means via a sparse product, then the member
+    nearest each centroid via a single lexsort.
+    """
+    weights = df["weight"].to_numpy()
+    rows = np.flatnonzero(labels >= 0)
+    if len(rows) == 0:
+        return {"report": [], "centroids": {}, "cluster_map": {}}
+
+    cluster_ids, group = np.unique(labels[rows], return_inverse=True)
+    centroids = _grouped_means(norm_embeddings, rows, group, weights[rows], len(cluster_ids))
+    distances = _distances_to_own_centroid(norm_embeddings, rows, group, centroids)
+
+    # Members ordered by (cluster, distance): the first of each run is the representative
+    order = np.lexsort((distances, group))
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(group[order])) + 1))
+    ends = np.concatenate((starts[1:], [len(order)]))
+
+    questions = df["Questions"].to_numpy()
+    member_ids = df["ids"].to_numpy()
+
+    output_report = []
     centroid_map = {}
     cluster_mapping = {}
 
-    for label in unique_labels:
-        # 1. Get all rows for this cluster
-        mask = df['cluster'] == label
-        cluster_rows = df[mask]
-        cluster_vectors = norm_embeddings[mask]
-
-        # 2. Calculate Centroid (Average Vector)
-        centroid = np.mean(cluster_vectors, axis=0).reshape(1, -1)
-        centroid_map[int(label)] = centroid[0].tolist() # Store as list for JSON serialization
-
-        # 3. Find the question closest to the Centroid
-        # We calculate distance from every point in this cluster to the centroid
-        distances = euclidean_distances(cluster_vectors, centroid)
-        closest_index_local = np.argmin(distances)
-        
-        # 4. Get the actual text and ID of that "Central" question
-        representative_row = cluster_rows.iloc[closest_index_local]
-        
-        # 5. Collect all IDs in this cluster
-        all_ids = cluster_rows['id'].tolist()
-
-        # 6. Build Output Object
+    for k, label in enumerate(cluster_ids):
+        members = rows[order[starts[k]:ends[k]]]
+        all_ids = [qid for ids_of_item in member_ids[members] for qid in ids_of_item]
+
         cluster_info = {
             "cluster_id": int(label),
-            "representative_question": representative_row['Questions'],
+            "representative_question": questions[members[0]],
             "question_ids": all_ids,
             "count": len(all_ids)
         }
         output_report.append(cluster_info)
         cluster_mapping[int(label)] = cluster_info
+        centroid_map[int(label)] = centroids[k].tolist() # Store as list for JSON serialization
 
     return {
         "report": output_report,
@@ -96,8 +221,58 @@ def get_clusters_with_representatives(questions, ids, embed_model=None):
         "cluster_map": cluster_mapping
     }
 
+def cluster_from_embeddings(df, norm_embeddings, mode="auto", progress=None, similarity_index=True,
+                            min_cluster_size=MIN_CLUSTER_SIZE, min_samples=MIN_SAMPLES):
+    """
+    Clusters already-embedded unique questions (output of collapse_questions).
+
+    mode="exact"     HDBSCAN over all points in the full embedding space.
+    mode="scalable"  PCA + sampled HDBSCAN + chunked nearest-centroid assignment.
+    mode="auto"      scalable above AUTO_SCALABLE_ABOVE unique questions.
+
+    With similarity_index=True the results also carry a SimilarityIndex over
+    every unique question (noise included) under "similarity_index".
+    """
+    report_progress = progress or (lambda phase, done, total: None)
+    if mode == "auto":
+        mode = "scalable" if len(df) > AUTO_SCALABLE_ABOVE else "exact"
+    if mode not in ("exact", "scalable"):
+        raise ValueError(f"Unknown clustering mode: {mode}")
+
+    print(f"Clustering with HDBSCAN ({mode} mode)...")
+    report_progress("clustering", 0, 1)
+    if mode == "scalable":
+        labels = cluster_scalable(norm_embeddings, df["weight"].to_numpy(),
+                                  min_cluster_size=min_cluster_size, min_samples=min_samples)
+    else:
+        labels = _hdbscan_weighted(norm_embeddings, df["weight"].to_numpy(), min_cluster_size, min_samples)
+    df['cluster'] = labels
+    print(f"Clustering complete. Found {len(set(labels))} clusters (including noise).")
+    report_progress("clustering", 1, 1)
+
+    report_progress("representatives", 0, 1)
+    results = summarize_clusters(df, norm_embeddings, labels)
+    report_progress("representatives", 1, 1)
+
+    if similarity_index:
+        report_progress("similarity_index", 0, 1)
+        results["similarity_index"] = SimilarityIndex.build(norm_embeddings, df["Questions"], df["ids"])
+        report_progress("similarity_index", 1, 1)
+    return results
+
 # Run it
 if __name__ == "__main__":
+    df = pd.read_csv('processed_issues_uuid.csv')
+    # if 'id' not in df.columns:
+    #     df['id'] = range(1, len(df) + 1)
+    df2 = pd.read_csv("pm_ajay_final_simulated_data.csv")
+    df2.columns = df2.columns.str.strip()
+    for col in df2.select_dtypes(include=['object']).columns:
+        df2[col] = df2[col].str.strip()
+    df2['id'] = range(1, len(df2) + 1)
+    # df2["questions"] = df2["Doubt"].astype(str) + " " + df2["Issue_Raised"].astype(str)
+    df2["questions"] = df2["Doubt"]
+
     # Clean columns first
     df.columns = df.columns.str.strip()
     for col in df.select_dtypes(include=['object']).columns:
@@ -105,12 +280,16 @@ if __name__ == "__main__":
 
     # Call the function with specific columns
     # 'Issue' contains the questions, 'Issue_Id' contains the IDs matches processed_issues_uuid.csv
-    results = get_clusters_with_representatives(df2["questions"], df2["id"])
+    from embedding_cache import EmbeddingCache
+    results = get_clusters_with_representatives(
+        df2["questions"], df2["id"], embedding_cache=EmbeddingCache(MODEL_NAME)
+    )
 
     # Print Result
     import json
     import re
     
+    results.pop("similarity_index", None)
     json_output = json.dumps(results, indent=2)
     
     # Compact the question_ids lists to be horizontal
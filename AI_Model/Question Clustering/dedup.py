@@ -0,0 +1,309 @@
+import json
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# --- Configuration ---
+NUM_PERM = 64          # MinHash permutations per field
+LSH_BANDS = 16         # 16 bands x 4 rows -> candidate threshold ~0.5 Jaccard
+WINDOW = 3             # Sorted-neighbourhood window inside each LSH bucket
+MATCH_THRESHOLD = 0.7  # Minimum weighted similarity to call two records duplicates
+NAME_THRESHOLD = 0.75  # Common names repeat across districts, so both fields must agree
+ADDRESS_THRESHOLD = 0.5
+NAME_WEIGHT = 0.6
+ADDRESS_WEIGHT = 0.4
+CHUNK_SIZE = 100_000
+
+_MAX_HASH = np.uint32(np.iinfo(np.uint32).max)
+
+
+def normalize_aadhaar(values):
+    """Keeps digits only; anything that is not a 12 digit number becomes empty."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        # A blank cell makes pandas read the column as float: 123456789012.0 -> "123456789012"
+        values = pd.to_numeric(values, errors="coerce").round().astype("Int64").astype(str)
+    digits = values.astype(str).str.replace(r"\D", "", regex=True)
+    return digits.where(digits.str.len() == 12, "")
+
+
+def normalize_text(values):
+    """Lowercases, drops punctuation and collapses whitespace."""
+    text = pd.Series(values).fillna("").astype(str).str.lower()
+    text = text.str.replace(r"[^\w\s]", " ", regex=True)
+    return text.str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def _shingle_hashes(texts, max_len):
+    """
+    Character 3-gram hashes for every string, computed as one (n, max_len - 2) matrix.
+    Invalid positions (past the end of the string) are flagged in the returned mask.
+    Strings shorter than 3 bytes have no 3-grams; they get one shingle encoding the
+    whole string instead, so they only ever match an identical string.
+    """
+    encoded = np.array([t.encode("utf-8")[:max_len] for t in texts], dtype=f"S{max_len}")
+    lengths = np.char.str_len(encoded)
+    raw = encoded.view(np.uint8).reshape(len(texts), max_len).astype(np.uint64)
+
+    grams = (raw[:, :-2] << np.uint64(16)) | (raw[:, 1:-1] << np.uint64(8)) | raw[:, 2:]
+    valid = np.arange(max_len - 2)[None, :] < (lengths[:, None] - 2)
+
+    # 3-grams are 24-bit values; bits 24+ tag whole-string shingles with their length
+    short = lengths < 3
+    grams[short, 0] = (raw[short, 0] << np.uint64(8)) | raw[short, 1] | \
+        ((lengths[short].astype(np.uint64) + np.uint64(1)) << np.uint64(24))
+    valid[short, 0] = True
+    return grams, valid
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, max_len=None, seed=42):
+    """
+    MinHash signatures (n, num_perm) over character 3-grams.
+    Uses multiply-shift hashing (no modulo) and processes rows in chunks,
+    so memory stays flat for millions of records. Strings under 3 bytes (including
+    empty ones) share a signature only with identical strings.
+
+    Whole strings are shingled unless `max_len` caps them (in UTF-8 bytes). Rows are
+    chunked in order of length, so one long outlier only widens its own chunk.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 62, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 62, size=num_perm, dtype=np.uint64)
+
+    texts = list(texts)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    lengths = np.array([len(t.encode("utf-8")) for t in texts], dtype=np.int64)
+    if max_len:
+        lengths = np.minimum(lengths, max_len)
+    order = np.argsort(lengths, kind="stable")
+
+    start = 0
+    while start < len(texts):
+        # Up to CHUNK_SIZE rows of 64 bytes' worth of cells per chunk
+        end = min(len(texts), start + CHUNK_SIZE)
+        width = max(3, int(lengths[order[end - 1]]))
+        end = min(end, start + max(1, CHUNK_SIZE * 64 // width))
+        width = max(3, int(lengths[order[end - 1]]))
+        chunk_rows = order[start:end]
+        start = end
+
+        grams, valid = _shingle_hashes([texts[i] for i in chunk_rows], width)
+        chunk_sig = np.full((len(chunk_rows), num_perm), _MAX_HASH, dtype=np.uint32)
+
+        # Hash only the real shingles, then take per-row minima with reduceat
+        counts = valid.sum(axis=1)
+        rows = np.flatnonzero(counts)
+        if len(rows):
+            flat = grams[valid]
+            offsets = np.concatenate(([0], np.cumsum(counts[rows])[:-1]))
+            for k in range(num_perm):
+                hashed = ((a[k] * flat + b[k]) >> np.uint64(32)).astype(np.uint32)
+                chunk_sig[rows, k] = np.minimum.reduceat(hashed, offsets)
+        signatures[chunk_rows] = chunk_sig
+
+    return signatures
+
+
+def _band_candidates(signatures, eligible, bands=LSH_BANDS, window=WINDOW):
+    """
+    LSH banding: records sharing a band bucket become candidates.
+    Inside a bucket only the `window` nearest neighbours (in sorted order) are paired,
+    so a huge bucket costs O(size * window) instead of O(size^2).
+    """
+    rows = signatures.shape[1] // bands
+    idx = np.flatnonzero(eligible)
+    pairs = []
+
+    for band in range(bands):
+        block = signatures[idx, band * rows:(band + 1) * rows].astype(np.uint64)
+        key = np.zeros(len(idx), dtype=np.uint64)
+        for col in range(rows):
+            key = key * np.uint64(1_000_003) + block[:, col]
+
+        order = np.argsort(key, kind="stable")
+        sorted_key = key[order]
+        for d in range(1, window + 1):
+            same = sorted_key[:-d] == sorted_key[d:]
+            if same.any():
+                band_pairs = np.column_stack((idx[order[:-d][same]], idx[order[d:][same]]))
+                pairs.append(_pack_pairs(band_pairs))
+
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return _unpack_pairs(np.unique(np.concatenate(pairs)))
+
+
+def _exact_pairs(keys):
+    """Chains every group of identical non-empty keys: (g0, g1), (g1, g2), ..."""
+    keys = np.asarray(keys, dtype=object)
+    idx = np.flatnonzero(keys != "")
+    if len(idx) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+
+    order = idx[np.argsort(keys[idx], kind="stable")]
+    same = keys[order[:-1]] == keys[order[1:]]
+    return np.column_stack((order[:-1][same], order[1:][same]))
+
+
+def _pack_pairs(pairs):
+    """Orders each pair (lo, hi), drops self-pairs and packs it into one int64."""
+    lo = np.minimum(pairs[:, 0], pairs[:, 1]).astype(np.int64)
+    hi = np.maximum(pairs[:, 0], pairs[:, 1]).astype(np.int64)
+    keep = lo != hi
+    return lo[keep] * (1 << 32) + hi[keep]
+
+
+def _unpack_pairs(packed):
+    return np.column_stack((packed >> 32, packed & 0xFFFFFFFF))
+
+
+def _score_candidates(candidates, name_sig, addr_sig, house_numbers, threshold):
+    """
+    Estimates name / address Jaccard from MinHash agreement for each candidate pair.
+    Templated addresses ("House No. 12, SC Colony") differ mainly by number,
+    so pairs whose address numbers disagree are rejected outright.
+    """
+    kept_pairs, kept_scores = [], []
+    for start in range(0, len(candidates), CHUNK_SIZE):
+        chunk = candidates[start:start + CHUNK_SIZE]
+        left, right = chunk[:, 0], chunk[:, 1]
+
+        name_sim = (name_sig[left] == name_sig[right]).mean(axis=1)
+        addr_sim = (addr_sig[left] == addr_sig[right]).mean(axis=1)
+        score = NAME_WEIGHT * name_sim + ADDRESS_WEIGHT * addr_sim
+
+        numbers_agree = (house_numbers[left] == house_numbers[right]) | \
+                        (house_numbers[left] == "") | (house_numbers[right] == "")
+        keep = (score >= threshold) & (name_sim >= NAME_THRESHOLD) & \
+               (addr_sim >= ADDRESS_THRESHOLD) & numbers_agree
+        kept_pairs.append(chunk[keep])
+        kept_scores.append(score[keep])
+
+    if not kept_pairs:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0)
+    return np.vstack(kept_pairs), np.concatenate(kept_scores)
+
+
+def group_near_duplicates(texts, threshold=0.8):
+    """
+    Groups near-identical short texts (character 3-gram MinHash + LSH).
+    Returns a label per text; texts sharing a label are near-duplicates.
+    """
+    texts = list(texts)
+    signatures = minhash_signatures(texts)
+    eligible = np.array([bool(t) for t in texts])
+    candidates = _band_candidates(signatures, eligible)
+
+    labels = np.arange(len(texts))
+    if len(candidates):
+        sim = np.concatenate([
+            (signatures[chunk[:, 0]] == signatures[chunk[:, 1]]).mean(axis=1)
+            for chunk in np.array_split(candidates, max(1, len(candidates) // CHUNK_SIZE))
+        ])
+        matched = candidates[sim >= threshold]
+        graph = coo_matrix(
+            (np.ones(len(matched)), (matched[:, 0], matched[:, 1])), shape=(len(texts), len(texts))
+        )
+        _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def find_duplicate_clusters(df, id_col="id", name_col="Name", address_col="Address",
+                            aadhaar_col="Aadhar", threshold=MATCH_THRESHOLD):
+    """
+    Flags duplicate / near-duplicate applicants.
+
+    1. Exact matches on normalized Aadhaar (score 1.0).
+    2. Fuzzy matches on name + address: MinHash signatures, LSH blocking,
+       then a weighted MinHash similarity check on each candidate pair.
+    3. Matched pairs are joined into clusters with connected components.
+
+    Every step is a sort or a vectorized pass, so runtime is near-linear in rows.
+    Returns a list of clusters, largest first.
+    """
+    n = len(df)
+    ids = df[id_col].tolist() if id_col in df.columns else list(range(1, n + 1))
+    print(f"Deduplicating {n} records...")
+
+    # 1. Exact Aadhaar matches
+    aadhaar = normalize_aadhaar(df[aadhaar_col]).to_numpy()
+    exact = _unpack_pairs(np.unique(_pack_pairs(_exact_pairs(aadhaar))))
+    print(f"Exact Aadhaar pairs: {len(exact)}")
+
+    # 2. Fuzzy name + address matches
+    names = normalize_text(df[name_col]).tolist()
+    addresses = normalize_text(df[address_col])
+    house_numbers = addresses.str.findall(r"\d+").str.join(" ").to_numpy(dtype=object)
+    addresses = addresses.tolist()
+    name_sig = minhash_signatures(names, max_len=48)
+    addr_sig = minhash_signatures(addresses, max_len=96, seed=7)
+
+    eligible = np.array([bool(nm) for nm in names])
+    # Interleave name and address rows so every LSH band needs both fields to agree
+    combined = np.empty_like(name_sig)
+    combined[:, 0::2] = name_sig[:, :NUM_PERM // 2]
+    combined[:, 1::2] = addr_sig[:, :NUM_PERM // 2]
+    candidates = _band_candidates(combined, eligible)
+    print(f"Fuzzy candidate pairs after blocking: {len(candidates)}")
+
+    fuzzy, fuzzy_score = _score_candidates(candidates, name_sig, addr_sig, house_numbers, threshold)
+    print(f"Fuzzy pairs above threshold {threshold}: {len(fuzzy)}")
+
+    edges = pd.DataFrame({
+        "left": np.concatenate((exact[:, 0], fuzzy[:, 0])).astype(np.int64),
+        "right": np.concatenate((exact[:, 1], fuzzy[:, 1])).astype(np.int64),
+        "score": np.concatenate((np.ones(len(exact)), fuzzy_score)),
+        "match_type": ["aadhaar"] * len(exact) + ["fuzzy"] * len(fuzzy),
+    })
+    if edges.empty:
+        return []
+
+    # Keep the strongest evidence when a pair matched both ways
+    edges = edges.sort_values("score", ascending=False).drop_duplicates(["left", "right"])
+
+    # 3. Connected components over the match graph
+    graph = coo_matrix(
+        (np.ones(len(edges)), (edges["left"], edges["right"])), shape=(n, n)
+    )
+    _, labels = connected_components(graph, directed=False)
+    edges["cluster"] = labels[edges["left"].to_numpy()]
+
+    members = pd.DataFrame({"row": np.arange(n), "cluster": labels})
+    members = members[members["cluster"].isin(edges["cluster"].unique())]
+    grouped_rows = members.groupby("cluster")["row"].apply(list)
+    grouped_edges = edges.groupby("cluster").agg(
+        match_score=("score", "mean"),
+        min_pair_score=("score", "min"),
+        match_types=("match_type", lambda s: sorted(set(s))),
+    )
+
+    stats_by_label = grouped_edges.to_dict(orient="index")
+
+    report = []
+    for label, rows in grouped_rows.items():
+        stats = stats_by_label[label]
+        report.append({
+            "cluster_id": int(label),
+            "record_ids": [ids[r] for r in rows],
+            "count": len(rows),
+            "match_score": round(float(stats["match_score"]), 4),
+            "min_pair_score": round(float(stats["min_pair_score"]), 4),
+            "match_types": stats["match_types"],
+        })
+
+    report.sort(key=lambda c: (-c["count"], -c["match_score"]))
+    print(f"Found {len(report)} duplicate clusters.")
+    return report
+
+
+# Run it
+if __name__ == "__main__":
+    df = pd.read_csv("pm_ajay_final_simulated_data.csv", skipinitialspace=True)
+    df.columns = df.columns.str.strip()
+    for col in df.select_dtypes(include=["object"]).columns:
+        df[col] = df[col].str.strip()
+    df["id"] = range(1, len(df) + 1)
+
+    clusters = find_duplicate_clusters(df)
+    print(json.dumps(clusters[:20], indent=2, default=str))
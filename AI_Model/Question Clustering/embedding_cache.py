@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, only one process may write a cache directory
+    fcntl = None
+
+DEFAULT_CACHE_DIR = "./embedding_cache"
+KEY_SIZE = 16  # bytes of blake2b digest per cached row
+
+
+def normalize_question(text):
+    """Whitespace / case normalization shared by the cache key and the encoder input."""
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def question_key(text, model_name):
+    """Content address of a question: hash of (model name, normalized text)."""
+    payload = f"{model_name}\0{normalize_question(text)}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=KEY_SIZE).digest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed, content-addressed embedding cache.
+
+    Layout (one directory per model):
+        vectors.f32  - float32 matrix, one row per cached question (memory-mapped)
+        keys.bin     - 16 byte key per row, in the same order (the index file)
+        meta.json    - model name and embedding dimension
+
+    Both data files are append-only: vectors are written before their keys,
+    so a crash mid-append can only leave an orphan vector that is ignored on load.
+    Appends hold an exclusive lock on `.lock` and first pick up rows written by other
+    processes (several uvicorn workers or jobs can share one cache directory).
+    """
+
+    def __init__(self, model_name, cache_dir=DEFAULT_CACHE_DIR):
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.vectors_file = os.path.join(self.path, "vectors.f32")
+        self.keys_file = os.path.join(self.path, "keys.bin")
+        self.meta_file = os.path.join(self.path, "meta.json")
+        self.lock_file = os.path.join(self.path, ".lock")
+
+        self.dim = None
+        self.index = {}      # key -> row
+        self.vectors = None  # read-only memmap over vectors.f32
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_file):
+            return
+
+        with open(self.meta_file, "r") as f:
+            meta = json.load(f)
+        if meta.get("model_name") != self.model_name:
+            print(f"⚠️  Embedding cache at {self.path} belongs to {meta.get('model_name')}, ignoring it.")
+            return
+        self.dim = int(meta["dim"])
+
+        keys = b""
+        if os.path.exists(self.keys_file):
+            with open(self.keys_file, "rb") as f:
+                keys = f.read()
+        vector_rows = os.path.getsize(self.vectors_file) // (4 * self.dim) if os.path.exists(self.vectors_file) else 0
+        rows = min(len(keys) // KEY_SIZE, vector_rows)
+
+        self.index = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(rows)}
+        self._remap(rows)
+        print(f"📂 Loaded embedding cache with {rows} vectors ({self.model_name}).")
+
+    def _remap(self, rows):
+        if rows == 0:
+            self.vectors = None
+            return
+        self.vectors = np.memmap(self.vectors_file, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def __len__(self):
+        return len(self.index)
+
+    def _disk_rows(self):
+        """Complete rows on disk: both the vector and its key have been written."""
+        keys_rows = os.path.getsize(self.keys_file) // KEY_SIZE if os.path.exists(self.keys_file) else 0
+        vector_rows = os.path.getsize(self.vectors_file) // (4 * self.dim) if os.path.exists(self.vectors_file) else 0
+        return min(keys_rows, vector_rows)
+
+    def _catch_up(self, rows):
+        """Indexes rows other processes appended since this instance last read keys.bin."""
+        known = len(self.index)
+        if rows <= known:
+            return
+        with open(self.keys_file, "rb") as f:
+            f.seek(known * KEY_SIZE)
+            keys = f.read((rows - known) * KEY_SIZE)
+        for offset in range(rows - known):
+            self.index.setdefault(keys[offset * KEY_SIZE:(offset + 1) * KEY_SIZE], known + offset)
+
+    def _append(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with open(self.lock_file, "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.dim is None:
+                    # Another process may have created the cache since this one started
+                    self._load()
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                    with open(self.meta_file, "w") as f:
+                        json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+
+                start = self._disk_rows()
+                self._catch_up(start)
+                fresh = [(key, vector) for key, vector in zip(keys, vectors) if key not in self.index]
+
+                # Truncate any orphan rows left by an interrupted append before writing
+                with open(self.vectors_file, "ab") as f:
+                    f.truncate(start * 4 * self.dim)
+                    f.write(b"".join(vector.tobytes() for _, vector in fresh))
+                with open(self.keys_file, "ab") as f:
+                    f.truncate(start * KEY_SIZE)
+                    f.write(b"".join(key for key, _ in fresh))
+
+                for offset, (key, _) in enumerate(fresh):
+                    self.index[key] = start + offset
+                self._remap(start + len(fresh))
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get_or_encode(self, texts, encode_fn):
+        """
+        Returns a float32 matrix (len(texts), dim) in input order.
+        Only questions missing from the cache (deduplicated) are passed to `encode_fn`,
+        which takes a list of strings and returns their embeddings.
+        """
+        keys = [question_key(t, self.model_name) for t in texts]
+
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self.index and key not in missing:
+                    missing[key] = normalize_question(text)
+
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+            print(f"Embedding cache: {len(keys) - len(missing)} hits, {len(missing)} to encode.")
+
+            if missing:
+                new_vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+                self._append(list(missing.keys()), new_vectors)
+
+            rows = np.fromiter((self.index[k] for k in keys), dtype=np.int64, count=len(keys))
+            if len(rows) == 0:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            return np.asarray(self.vectors[rows])
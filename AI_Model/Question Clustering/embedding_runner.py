@@ -0,0 +1,142 @@
+import time
+import argparse
+import numpy as np
+
+DEFAULT_TOKEN_BUDGET = 8192  # padded tokens per forward pass (batch size x longest member)
+MAX_BATCH_SIZE = 512
+
+
+def token_lengths(texts, model, chunk_size=10_000):
+    """
+    Token count per text using the model's own tokenizer (truncated at its max length).
+    Falls back to a whitespace word count when the model exposes no tokenizer.
+    """
+    tokenizer = getattr(model, "tokenizer", None)
+    max_len = model.get_max_seq_length() if hasattr(model, "get_max_seq_length") else 512
+    if tokenizer is None:
+        return np.array([min(len(t.split()) + 2, max_len) for t in texts], dtype=np.int64)
+
+    lengths = []
+    for i in range(0, len(texts), chunk_size):
+        encoded = tokenizer(texts[i:i + chunk_size], truncation=True, max_length=max_len)
+        lengths.extend(len(ids) for ids in encoded["input_ids"])
+    return np.array(lengths, dtype=np.int64)
+
+
+def plan_batches(lengths, token_budget=DEFAULT_TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Sorts texts longest-first and cuts batches so that (batch size x longest member)
+    stays under the token budget. Returns (order, list of (start, end) into order).
+    """
+    order = np.argsort(-lengths, kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_batch_size, token_budget // longest))
+        end = min(start + size, len(order))
+        batches.append((start, end))
+        start = end
+    return order, batches
+
+
+def encode_questions(texts, model, token_budget=DEFAULT_TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE,
+                     pool=None, log_every=50, progress=None):
+    """
+    Length-bucketed dynamic batching around SentenceTransformer.encode.
+
+    Similar-length questions share a batch, so little compute is spent on padding,
+    and batch size adapts to the token budget instead of being a fixed count.
+    With `pool` (from model.start_multi_process_pool()), the length-sorted input
+    is fanned out across worker processes instead. Output is in input order.
+    `progress(done, total)` is called after every batch when given.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    lengths = token_lengths(texts, model)
+    order, batches = plan_batches(lengths, token_budget, max_batch_size)
+    sorted_texts = [texts[i] for i in order]
+
+    if pool is not None:
+        # Workers receive contiguous chunks of the sorted list, so each chunk is
+        # already length-homogeneous; use the median planned batch size for them.
+        batch_size = int(np.median([end - start for start, end in batches]))
+        encoded = model.encode_multi_process(sorted_texts, pool, batch_size=batch_size)
+        encoded = np.asarray(encoded, dtype=np.float32)
+    else:
+        encoded = None
+        for n, (start, end) in enumerate(batches, 1):
+            batch = model.encode(sorted_texts[start:end], batch_size=end - start,
+                                 convert_to_numpy=True, show_progress_bar=False)
+            if encoded is None:
+                encoded = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            encoded[start:end] = batch
+            if progress:
+                progress(end, len(texts))
+            if n % log_every == 0 or n == len(batches):
+                print(f"Encoded batch {n}/{len(batches)} ({end}/{len(texts)} questions)")
+
+    # Restore the caller's order
+    result = np.empty_like(encoded)
+    result[order] = encoded
+    return result
+
+
+def encode_fixed_batches(texts, model, batch_size=25):
+    """The original clusters.py loop: fixed-count batches in input order (benchmark baseline)."""
+    all_embeddings = []
+    for i in range(0, len(texts), batch_size):
+        all_embeddings.extend(model.encode(texts[i:i + batch_size]))
+    return np.asarray(all_embeddings, dtype=np.float32)
+
+
+def _benchmark_corpus(size, seed=0):
+    """Mixes the short simulated doubts with the longer 'issue + doubt' texts, repeated to size."""
+    import pandas as pd
+    doubts = pd.read_csv("pm_ajay_final_simulated_data.csv", skipinitialspace=True)
+    doubts.columns = doubts.columns.str.strip()
+    issues = pd.read_csv("processed_issues_uuid.csv")
+    issues.columns = issues.columns.str.strip()
+
+    pool = doubts["Doubt"].str.strip().tolist() + issues["Issue"].str.strip().tolist()
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(pool), size=size)
+    # Suffix a number so repeats are not identical strings
+    return [f"{pool[p]} (ref {i})" for i, p in enumerate(picks)]
+
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+    from clusters import MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Questions/sec: fixed batches of 25 vs length-bucketed batching")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma separated corpus sizes")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--workers", type=int, default=0, help="CPU worker processes (0 = in-process)")
+    parser.add_argument("--skip-baseline-above", type=int, default=100000,
+                        help="Skip the slow fixed-batch loop for corpora larger than this")
+    args = parser.parse_args()
+
+    model = SentenceTransformer(MODEL_NAME)
+    pool = model.start_multi_process_pool(["cpu"] * args.workers) if args.workers else None
+
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            texts = _benchmark_corpus(size)
+            row = {"questions": size}
+
+            if size <= args.skip_baseline_above:
+                start = time.perf_counter()
+                encode_fixed_batches(texts, model)
+                row["fixed_25_qps"] = round(size / (time.perf_counter() - start), 1)
+
+            start = time.perf_counter()
+            encode_questions(texts, model, token_budget=args.token_budget, pool=pool)
+            row["bucketed_qps"] = round(size / (time.perf_counter() - start), 1)
+
+            print(row)
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
@@ -0,0 +1,92 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 2        # clustering jobs running at the same time
+MAX_KEPT_JOBS = 50     # finished jobs kept for retrieval (oldest dropped first)
+
+
+class JobManager:
+    """
+    Runs long clustering calls on a worker pool and tracks their progress.
+
+    The submitted function is called with a `progress(phase, done, total)` keyword
+    argument; every call updates the job's status record. Finished jobs keep their
+    result (or error) until MAX_KEPT_JOBS newer jobs have finished.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_kept=MAX_KEPT_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cluster-job")
+        self.max_kept = max_kept
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, on_done=None, **kwargs):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "phase": None,
+                "progress": {},
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "error": None,
+                "result": None
+            }
+        self.executor.submit(self._run, job_id, fn, args, kwargs, on_done)
+        return job_id
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields)
+
+    def _run(self, job_id, fn, args, kwargs, on_done):
+        self._update(job_id, status="running", started_at=time.time())
+
+        def progress(phase, done, total):
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    return
+                job["phase"] = phase
+                job["progress"][phase] = {
+                    "done": int(done),
+                    "total": int(total),
+                    "percent": round(100.0 * done / total, 1) if total else 100.0
+                }
+
+        try:
+            result = fn(*args, progress=progress, **kwargs)
+            if on_done:
+                on_done(result)
+            self._update(job_id, status="completed", result=result, finished_at=time.time())
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            finished = [jid for jid, job in self.jobs.items() if job["status"] in ("completed", "failed")]
+            for jid in finished[:max(0, len(finished) - self.max_kept)]:
+                del self.jobs[jid]
+
+    def status(self, job_id):
+        """Job record without the (possibly large) result payload, or None."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            record = {k: v for k, v in job.items() if k != "result"}
+            record["progress"] = dict(job["progress"])
+            return record
+
+    def result(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
@@ -0,0 +1,174 @@
+import threading
+import numpy as np
+
+from cluster_state import ClusterState, NOISE_THRESHOLD
+
+# A full re-cluster is scheduled once either limit is crossed
+NOISE_POOL_MIN = 30         # never trigger on fewer pending-noise items than a minimum cluster
+NOISE_POOL_FRACTION = 0.05  # ... or than this share of the corpus
+DRIFT_THRESHOLD = 0.1       # max distance any centroid moved away from its clustered position
+
+
+class OnlineClusterer:
+    """
+    Assigns newly arriving questions to the current clusters one at a time and
+    re-clusters the whole corpus in the background only when needed.
+
+    - ingest() costs one centroid comparison and one running-mean update per item.
+    - Items too far from every centroid wait in a pending-noise pool.
+    - When the pool or centroid drift crosses its threshold, `recluster_fn` runs on a
+      background thread over a snapshot of the corpus. Items ingested meanwhile are
+      replayed onto the new state, which then replaces the old one in one assignment.
+    """
+
+    def __init__(self, recluster_fn, on_swap=None, drift_threshold=DRIFT_THRESHOLD):
+        self.recluster_fn = recluster_fn   # (questions, ids) -> get_clusters_with_representatives results
+        self.on_swap = on_swap             # called with (results, new_state) after a background swap
+        self.drift_threshold = drift_threshold
+
+        self.state = ClusterState()
+        self.questions = []
+        self.ids = []
+        self.noise_pool = []               # [{"id": ..., "question": ...}]
+        self.max_drift = 0.0
+
+        self.is_reclustering = False
+        self._generation = 0
+        self._arrived_during_recluster = []
+        self._unpublished = []             # (question, id, embedding) ingested since the last snapshot
+        self._lock = threading.Lock()
+
+    def reset(self, questions, ids, results=None, state=None):
+        """
+        Adopts a fresh full clustering (e.g. from /cluster) as the new baseline.
+        Pass `state` instead of `results` to adopt an already built ClusterState.
+        """
+        with self._lock:
+            self._generation += 1
+            self.state = state if state is not None else ClusterState.from_results(results)
+            self.questions = list(questions)
+            self.ids = list(ids)
+            self.noise_pool = []
+            self.max_drift = 0.0
+            self._arrived_during_recluster = []
+            self._unpublished = []
+            return self.state
+
+    def adopt(self, questions, ids, state):
+        """
+        Switches to a snapshot published elsewhere (e.g. by another worker). Questions
+        ingested here but missing from that snapshot are replayed onto it, so they keep
+        their place (a cluster or the noise pool) instead of being dropped.
+        """
+        with self._lock:
+            known = set(ids)
+            pending = [item for item in self._unpublished if item[1] not in known]
+
+            self._generation += 1
+            self.state = state
+            self.questions = list(questions)
+            self.ids = list(ids)
+            self.noise_pool = []
+            self.max_drift = 0.0
+            self._arrived_during_recluster = []
+            self._unpublished = pending
+            if pending:
+                qs, qids, embs = zip(*pending)
+                cluster_ids, distances = self._assign(state, np.array(embs))
+                for q, qid, cid, dist, emb in zip(qs, qids, cluster_ids, distances, embs):
+                    self._place(state, q, qid, cid, dist, emb)
+                self.questions.extend(qs)
+                self.ids.extend(qids)
+            return self.state
+
+    def noise_pool_limit(self):
+        return max(NOISE_POOL_MIN, int(NOISE_POOL_FRACTION * len(self.questions)))
+
+    def needs_recluster(self):
+        return len(self.noise_pool) >= self.noise_pool_limit() or self.max_drift >= self.drift_threshold
+
+    def _place(self, state, question, qid, cluster_id, distance, embedding):
+        """Adds one item to `state` or to the noise pool. Caller holds the lock."""
+        if len(state) and distance <= NOISE_THRESHOLD:
+            self.max_drift = max(self.max_drift, state.add_member(cluster_id, embedding, qid))
+            return {"id": qid, "status": "assigned", **state.describe(cluster_id, distance)}
+
+        # Build the response first, so a failure cannot leave the item pooled but unreported
+        response = {"id": qid, "status": "pending_noise", "cluster_id": -1,
+                    "distance": float(distance) if distance is not None else None}
+        self.noise_pool.append({"id": qid, "question": question})
+        return response
+
+    def _assign(self, state, embeddings):
+        """Cluster ids and distances; distances are None while there are no clusters yet."""
+        if len(state):
+            return state.assign(embeddings)
+        return np.full(len(embeddings), -1), [None] * len(embeddings)
+
+    def ingest(self, questions, ids, embeddings):
+        """Places each new question immediately; may kick off a background re-cluster."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        with self._lock:
+            state = self.state
+            cluster_ids, distances = self._assign(state, embeddings)
+            assignments = [
+                self._place(state, q, qid, cid, dist, emb)
+                for q, qid, cid, dist, emb in zip(questions, ids, cluster_ids, distances, embeddings)
+            ]
+
+            self.questions.extend(questions)
+            self.ids.extend(ids)
+            self._unpublished.extend(zip(questions, ids, embeddings))
+            if self.is_reclustering:
+                self._arrived_during_recluster.extend(zip(questions, ids, embeddings))
+
+        self.maybe_recluster()
+        return assignments
+
+    def maybe_recluster(self):
+        with self._lock:
+            if self.is_reclustering or not self.needs_recluster():
+                return False
+            self.is_reclustering = True
+            generation = self._generation
+            snapshot = (list(self.questions), list(self.ids))
+
+        print(f"Re-clustering {len(snapshot[0])} questions in the background "
+              f"(noise pool: {len(self.noise_pool)}, drift: {self.max_drift:.3f})...")
+        threading.Thread(target=self._recluster, args=(generation, *snapshot), daemon=True).start()
+        return True
+
+    def _recluster(self, generation, questions, ids):
+        try:
+            results = self.recluster_fn(questions, ids)
+            new_state = ClusterState.from_results(results)
+
+            with self._lock:
+                if generation != self._generation:
+                    print("Background re-clustering superseded by a newer /cluster call; discarding.")
+                    return
+
+                # Replay everything that arrived after the snapshot onto the new state
+                arrived = self._arrived_during_recluster
+                self._arrived_during_recluster = []
+                self.noise_pool = []
+                self.max_drift = 0.0
+                if arrived:
+                    qs, qids, embs = zip(*arrived)
+                    cluster_ids, distances = self._assign(new_state, np.array(embs))
+                    for q, qid, cid, dist, emb in zip(qs, qids, cluster_ids, distances, embs):
+                        self._place(new_state, q, qid, cid, dist, emb)
+
+                self.state = new_state
+                if self.on_swap:
+                    self.on_swap(results, new_state)
+                    # on_swap snapshots the whole corpus, including the replayed items
+                    self._unpublished = []
+
+            print(f"Background re-clustering done. {len(new_state)} clusters now live.")
+        except Exception as e:
+            print(f"Background re-clustering failed: {e}")
+        finally:
+            with self._lock:
+                self.is_reclustering = False
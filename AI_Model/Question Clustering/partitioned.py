@@ -0,0 +1,184 @@
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from clusters import MODEL_NAME, MIN_CLUSTER_SIZE, MIN_SAMPLES, collapse_questions, cluster_from_embeddings
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_DIR
+from embedding_runner import encode_questions
+
+ROLLUP_DISTANCE = 0.3          # partition clusters whose centroids are this close form one global theme
+PARTITION_MIN_CLUSTER_SIZE = 5 # floor for the per-partition (share-scaled) HDBSCAN cluster size
+
+
+def _require_cached(texts):
+    raise RuntimeError(f"{len(texts)} questions missing from the shared embedding cache")
+
+
+def partition_cluster_sizes(partition_rows, total_rows):
+    """
+    HDBSCAN sizes for one partition: the global settings scaled by the partition's
+    share of the corpus (as scalable mode does for its sample), so a small state
+    can still form clusters of its own.
+    """
+    fraction = partition_rows / max(total_rows, 1)
+    min_cluster_size = max(PARTITION_MIN_CLUSTER_SIZE, round(MIN_CLUSTER_SIZE * fraction))
+    min_samples = max(2, min(min_cluster_size, round(MIN_SAMPLES * fraction)))
+    return min_cluster_size, min_samples
+
+
+def _cluster_partition(name, questions, ids, model_name, cache_dir, mode, min_cluster_size, min_samples):
+    """Runs in a worker process: embeddings come from the shared on-disk cache, never the model."""
+    start = time.perf_counter()
+    if len(questions) < min_cluster_size:
+        # Too small for HDBSCAN to form any cluster: everything is noise
+        results = {"report": [], "centroids": {}, "cluster_map": {}}
+    else:
+        cache = EmbeddingCache(model_name, cache_dir)
+        df = collapse_questions(questions, ids)
+        embeddings = cache.get_or_encode(df["Questions"].tolist(), _require_cached)
+        norm_embeddings = normalize(np.asarray(embeddings, dtype=np.float32), norm='l2')
+        results = cluster_from_embeddings(df, norm_embeddings, mode=mode, similarity_index=False,
+                                          min_cluster_size=min_cluster_size, min_samples=min_samples)
+
+    results["questions"] = len(questions)
+    results["seconds"] = round(time.perf_counter() - start, 3)
+    return name, results
+
+
+def rollup(partition_results, distance=ROLLUP_DISTANCE):
+    """
+    Global view over per-partition clusters: clusters from different partitions whose
+    centroids lie within `distance` of each other are merged into one theme.
+    Each theme lists the cluster ids it took from every partition: {partition: [cluster ids]}.
+    """
+    members = [
+        (name, cid, np.asarray(centroid, dtype=np.float32), results["cluster_map"][cid])
+        for name, results in partition_results.items()
+        for cid, centroid in results["centroids"].items()
+    ]
+    if not members:
+        return []
+
+    centroids = np.stack([m[2] for m in members])
+    sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    sq_dist = sq_norms[:, None] + sq_norms[None, :] - 2.0 * (centroids @ centroids.T)
+    close = csr_matrix(sq_dist <= distance ** 2)
+    n_themes, theme_of = connected_components(close, directed=False)
+
+    themes = []
+    for theme in range(n_themes):
+        in_theme = [members[i] for i in np.flatnonzero(theme_of == theme)]
+        largest = max(in_theme, key=lambda m: m[3]["count"])
+        # A partition can contribute several clusters to one theme
+        partitions = {}
+        for name, cid, _, _ in in_theme:
+            partitions.setdefault(str(name), []).append(int(cid))
+        themes.append({
+            "theme_id": theme,
+            "representative_question": largest[3]["representative_question"],
+            "count": sum(m[3]["count"] for m in in_theme),
+            "partitions": partitions
+        })
+    themes.sort(key=lambda t: -t["count"])
+    for theme_id, theme in enumerate(themes):
+        theme["theme_id"] = theme_id
+    return themes
+
+
+def get_partitioned_clusters(questions, ids, partitions, embed_model=None, embedding_cache=None,
+                             max_workers=None, mode="auto", progress=None):
+    """
+    Clusters each partition (e.g. each State) separately and concurrently.
+
+    1. Every distinct question is embedded once, in this process, into the shared
+       embedding cache (only cache misses reach the encoder).
+    2. Partitions are clustered in a process pool, largest first, with each worker
+       reading its embeddings from the cache on disk. Wall time is therefore bounded
+       by the largest partition once there are enough workers.
+    3. Per-partition results are rolled up into global themes.
+
+    Returns {"partitions": {name: results}, "rollup": [...], "seconds": ...}.
+    """
+    report_progress = progress or (lambda phase, done, total: None)
+    start = time.perf_counter()
+    frame = pd.DataFrame({"question": list(questions), "id": list(ids), "partition": list(partitions)})
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache(MODEL_NAME)
+
+    # 1. Warm the shared cache
+    model = embed_model
+    def encode(qs):
+        nonlocal model
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            print("Loading SentenceTransformer model...")
+            model = SentenceTransformer(embedding_cache.model_name)
+        return encode_questions(qs, model, progress=lambda done, total: report_progress("embedding", done, total))
+
+    unique_questions = collapse_questions(frame["question"], frame["id"])["Questions"].tolist()
+    embedding_cache.get_or_encode(unique_questions, encode)
+
+    # 2. Cluster partitions concurrently, largest first
+    groups = sorted(frame.groupby("partition", sort=False, dropna=False), key=lambda item: -len(item[1]))
+    workers = max_workers or min(len(groups), os.cpu_count() or 1)
+    print(f"Clustering {len(groups)} partitions on {workers} worker processes...")
+
+    partition_results = {}
+    report_progress("partitions", 0, len(groups))
+    # spawn: forking a process that holds a loaded torch model is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(_cluster_partition, name, group["question"].tolist(), group["id"].tolist(),
+                        embedding_cache.model_name, os.path.dirname(embedding_cache.path), mode,
+                        *partition_cluster_sizes(len(group), len(frame)))
+            for name, group in groups
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            name, results = future.result()
+            partition_results[name] = results
+            report_progress("partitions", done, len(groups))
+            print(f"Partition {name}: {results['questions']} questions, "
+                  f"{len(results['report'])} clusters in {results['seconds']}s.")
+
+    # 3. Global roll-up
+    themes = rollup(partition_results)
+    seconds = round(time.perf_counter() - start, 3)
+    slowest = max((r["seconds"] for r in partition_results.values()), default=0.0)
+    print(f"Partitioned clustering done in {seconds}s (largest partition: {slowest}s), "
+          f"{len(themes)} global themes.")
+
+    # Keep input order of partitions in the output
+    order = {name: i for i, name in enumerate(frame["partition"].drop_duplicates())}
+    return {
+        "partitions": dict(sorted(partition_results.items(), key=lambda item: order[item[0]])),
+        "rollup": themes,
+        "seconds": seconds
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster simulated doubts separately per partition column")
+    parser.add_argument("--by", default="State", help="Column to partition on (e.g. State, District)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    data = pd.read_csv("pm_ajay_final_simulated_data.csv", skipinitialspace=True)
+    data.columns = data.columns.str.strip()
+    data[args.by] = data[args.by].astype(str).str.strip()
+
+    results = get_partitioned_clusters(
+        data["Doubt"].astype(str).str.strip(), range(1, len(data) + 1), data[args.by],
+        embedding_cache=EmbeddingCache(MODEL_NAME, args.cache_dir), max_workers=args.workers
+    )
+    for name, partition in results["partitions"].items():
+        print(f"{name}: {partition['questions']} questions, {len(partition['report'])} clusters")
+    for theme in results["rollup"][:10]:
+        print(f"[{theme['count']}] {theme['representative_question']} ({len(theme['partitions'])} partitions)")
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, only one process may publish snapshots
+    fcntl = None
+
+from cluster_state import ClusterState
+from ann_index import SimilarityIndex
+
+DEFAULT_STATE_DIR = "./cluster_state"
+KEEP_VERSIONS = 5
+
+
+def _to_json(value):
+    # numpy scalars (e.g. integer ids read from a CSV) are not JSON serializable
+    return value.item()
+
+
+class StateStore:
+    """
+    Versioned on-disk snapshots of clustering results, shared by every worker process.
+
+    Layout:
+        CURRENT                 - number of the live version (replaced atomically)
+        v000042/centroids.npy   - float32 (k, d) centroid matrix, memory-mappable
+        v000042/cluster_ids.npy - int64 (k,) cluster id of each centroid row
+        v000042/cluster_map.json- representatives, member ids and counts per cluster
+        v000042/corpus.json     - questions and ids the clustering was built from
+        v000042/ivf_*           - SimilarityIndex over the clustered questions (optional)
+
+    A version directory is fully written under a temporary name and renamed into
+    place before CURRENT is switched, so readers never see a partial snapshot.
+    Claiming a version and switching CURRENT happen under an exclusive lock on `.lock`,
+    so concurrent writers cannot move CURRENT back to an older version.
+    """
+
+    def __init__(self, root=DEFAULT_STATE_DIR, keep=KEEP_VERSIONS):
+        self.root = root
+        self.keep = keep
+        self.pointer = os.path.join(root, "CURRENT")
+        self.lock_file = os.path.join(root, ".lock")
+        os.makedirs(root, exist_ok=True)
+
+    def _version_dir(self, version):
+        return os.path.join(self.root, f"v{version:06d}")
+
+    def _versions(self):
+        return sorted(
+            int(name[1:]) for name in os.listdir(self.root)
+            if name.startswith("v") and name[1:].isdigit()
+        )
+
+    def current_version(self):
+        try:
+            with open(self.pointer, "r") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, state, questions, ids):
+        """Writes a ClusterState and its corpus as a new snapshot, makes it current and returns its version."""
+        with state._lock:
+            cluster_ids = np.array(state.cluster_ids, dtype=np.int64)
+            centroids = np.array(state.centroids, dtype=np.float32)
+            cluster_map = json.dumps({str(cid): info for cid, info in state.cluster_map.items()}, default=_to_json)
+
+        tmp_dir = os.path.join(self.root, f".tmp-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "centroids.npy"), centroids)
+        np.save(os.path.join(tmp_dir, "cluster_ids.npy"), cluster_ids)
+        with open(os.path.join(tmp_dir, "cluster_map.json"), "w") as f:
+            f.write(cluster_map)
+        with open(os.path.join(tmp_dir, "corpus.json"), "w") as f:
+            json.dump({"questions": list(questions), "ids": list(ids)}, f, default=_to_json)
+        if state.similarity_index is not None:
+            state.similarity_index.save(tmp_dir)
+
+        with open(self.lock_file, "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Claim the next version number; retry if a writer without the lock got there first
+                while True:
+                    versions = self._versions()
+                    version = (versions[-1] if versions else 0) + 1
+                    try:
+                        os.rename(tmp_dir, self._version_dir(version))
+                        break
+                    except OSError:
+                        if not os.path.exists(self._version_dir(version)):
+                            raise
+
+                # Only ever move CURRENT forward
+                if (self.current_version() or 0) < version:
+                    tmp_pointer = f"{self.pointer}.{os.getpid()}.tmp"
+                    with open(tmp_pointer, "w") as f:
+                        f.write(str(version))
+                    os.replace(tmp_pointer, self.pointer)
+
+                self._prune(version)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+        print(f"💾 Saved cluster state v{version} ({len(cluster_ids)} clusters).")
+        return version
+
+    def _prune(self, current):
+        for version in self._versions()[:-self.keep]:
+            if version != current:
+                shutil.rmtree(self._version_dir(version), ignore_errors=True)
+
+    def load(self, version=None):
+        """
+        Loads a snapshot (the current one by default).
+        Returns (version, ClusterState, questions, ids) or None when nothing is saved.
+        Centroids are memory-mapped copy-on-write: online updates stay in this process.
+        Similarity index vectors are memory-mapped read-only.
+        """
+        version = version or self.current_version()
+        if version is None:
+            return None
+
+        path = self._version_dir(version)
+        centroids = np.load(os.path.join(path, "centroids.npy"), mmap_mode="c")
+        cluster_ids = np.load(os.path.join(path, "cluster_ids.npy"))
+        with open(os.path.join(path, "cluster_map.json"), "r") as f:
+            cluster_map = {int(cid): info for cid, info in json.load(f).items()}
+        with open(os.path.join(path, "corpus.json"), "r") as f:
+            corpus = json.load(f)
+
+        state = ClusterState.from_arrays(cluster_ids, centroids, cluster_map, SimilarityIndex.load(path))
+        return version, state, corpus["questions"], corpus["ids"]
@@ -1,22 +1,25 @@
 import json
 import os
 import sys
-from typing import List
+import time
+import argparse
+from typing import List, Tuple
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-# LLM Imports
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain_ollama import ChatOllama
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from tools import (
     check_financial_compliance, 
-    verify_vision_alignment, 
-    check_scheme_overlap, 
-    check_state_precedents
+    overlap_evidence,
+    vision_evidence,
+    precedent_evidence,
+    gather_evidence
 )
+from batch_audit import run_batch, rate_limiter_for, format_summary, DEFAULT_RESULTS_DIR, DEFAULT_WORKERS
+from report_cache import report_cache, model_id, estimate_tokens
+from prompt_assembly import assemble_evidence
+from llm_router import llm_from_env, LLMRouter
 
 load_dotenv()
 
@@ -36,114 +39,184 @@ class AnalysisReport(BaseModel):
 
 # --- 2. LLM Setup ---
 def init_llm():
-    provider = os.getenv("LLM_PROVIDER", "gemini").lower()
-    print(f"🧠 Initializing LLM Backend: {provider.upper()}")
-
-    if provider == "groq":
-        return ChatGroq(
-            model="llama-3.3-70b-versatile", temperature=0, 
-            api_key=os.getenv("GROQ_API_KEY"), max_retries=2
-        )
-    elif provider == "ollama":
-        return ChatOllama(model=os.getenv("OLLAMA_MODEL", "llama3.1"), temperature=0)
-    elif provider == "gemini":
-        return ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0, max_retries=2)
-    else:
-        raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+    """LLM_PROVIDER (default gemini), or a latency-aware router when LLM_PROVIDERS lists several."""
+    return llm_from_env(default_provider="gemini")
 
 # --- 3. Deterministic Tool Execution ---
-def execute_tools(data: dict, raw_json: str) -> str:
-    """Runs all validation tools locally and aggregates output."""
+def execute_tools(data: dict, raw_json: str, model: str = "", reserved_text: str = "") -> Tuple[str, dict]:
+    """
+    Runs all validation tools locally and aggregates output.
+    The tools are independent, so they run concurrently, each with its own timeout.
+    Retrieved chunks are deduplicated across tools and fitted to `model`'s prompt budget,
+    after `reserved_text` (the rest of the prompt).
+    Returns (aggregated output, {tool: {"seconds", "status"}}).
+    """
     print("�️  Running Deterministic Validation Tools...")
-    results = []
+    checks = {}
 
     # A. Financial Check
-    print("   ➤ Checking Financials...")
-    fin_result = check_financial_compliance.invoke(raw_json)
-    results.append(f"### 1. FINANCIAL COMPLIANCE CHECK\n{fin_result}")
+    checks["financial"] = lambda: check_financial_compliance.invoke(raw_json)
 
     # B. Scheme Overlap Check
     desc = data.get("projectInformation", {}).get("description", "")
     if desc:
-        print("   ➤ Checking Scheme Overlaps...")
-        overlap_result = check_scheme_overlap.invoke(desc)
-        results.append(f"### 2. SCHEME OVERLAP CHECK\n{overlap_result}")
+        checks["overlap"] = lambda: overlap_evidence(desc)
 
-    # C. Vision & Policy Check (Iterate over interventions)
+    # C. Vision & Policy Check (one batched retrieval for all interventions)
     interventions = data.get("interventionTypes", [])
     if interventions:
-        print("   ➤ Checking Vision Alignment...")
-        vision_results = []
-        for intervention in interventions:
-            res = verify_vision_alignment.invoke(intervention)
-            vision_results.append(f"- {intervention}: {res}")
-        results.append("### 3. VISION & POLICY ALIGNMENT\n" + "\n".join(vision_results))
+        checks["vision"] = lambda: vision_evidence(interventions)
 
     # D. State Precedents
     # Basic logic: take the first intervention or title as proxy for 'project type'
     project_type = data.get("projectInformation", {}).get("title", "General Project")
-    print("   ➤ Checking State Precedents...")
-    prec_result = check_state_precedents.invoke(project_type)
-    results.append(f"### 4. STATE PRECEDENTS\n{prec_result}")
+    checks["precedents"] = lambda: precedent_evidence(project_type)
+
+    evidence = gather_evidence(checks)
+    sections, prompt_stats = assemble_evidence(
+        {name: entry["output"] for name, entry in evidence.items()}, model, reserved_text
+    )
 
-    return "\n\n".join(results)
+    headings = {
+        "financial": "### 1. FINANCIAL COMPLIANCE CHECK",
+        "overlap": "### 2. SCHEME OVERLAP CHECK",
+        "vision": f"### 3. VISION & POLICY ALIGNMENT\nInterventions: {', '.join(interventions)}",
+        "precedents": "### 4. STATE PRECEDENTS"
+    }
+    results = [f"{headings[name]}\n{text}" for name, text in sections.items()]
+    timings = {name: {"seconds": entry["seconds"], "status": entry["status"]} for name, entry in evidence.items()}
+    timings["prompt"] = {"tokens": prompt_stats["prompt_tokens_after"], "tokens_saved": prompt_stats["prompt_tokens_saved"]}
+    return "\n\n".join(results), timings
 
 # --- 4. Main Execution ---
-def run_single_shot_analysis():
-    # Load Input
+REPORT_PROMPT_TEMPLATE = (
+    "You have been provided with the results of automated validation tools.\n"
+    "Your task is to synthesize these results into a final structured JSON report.\n\n"
+    "--- TOOL OUTPUTS ---\n{tool_outputs}\n\n"
+    "--- ORIGINAL PROJECT DATA ---\n{project_information}\n\n"
+    "Based ONLY on the tool outputs above, generate the AnalysisReport JSON."
+)
+
+def load_system_prompt() -> str:
     try:
-        with open("input2.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            raw_json = json.dumps(data)
-    except FileNotFoundError:
-        print("❌ input2.json not found.")
-        return
+        with open("SYSTEM_PROMPT.md", "r", encoding="utf-8") as f:
+            return f.read()
+    except:
+        return "You are a rigid validation auditor."
+
+def analyze_plan(data: dict, llm, base_prompt: str, rate_limiter=None) -> dict:
+    """
+    Tools + one LLM call for a single plan.
+    Returns the AnalysisReport fields plus evidence timings, or {"raw_report": ...}
+    when the provider cannot produce structured output.
+    `rate_limiter.acquire()` is called before every LLM request when given.
+    """
+    raw_json = json.dumps(data)
+    model = model_id(llm)
+    project_information = json.dumps(data.get('projectInformation', {}), indent=2)
 
     # 1. Execute Tools
-    tool_outputs = execute_tools(data, raw_json)
+    tool_outputs, tool_timings = execute_tools(
+        data, raw_json, model, reserved_text=base_prompt + REPORT_PROMPT_TEMPLATE + project_information
+    )
     
     # 2. Construct Prompt
     print("\n📝 Constructing Final Prompt...")
-    try:
-        with open("SYSTEM_PROMPT.md", "r", encoding="utf-8") as f:
-            base_prompt = f.read()
-    except:
-        base_prompt = "You are a rigid validation auditor."
-
-    final_prompt = (
-        f"You have been provided with the results of automated validation tools.\n"
-        f"Your task is to synthesize these results into a final structured JSON report.\n\n"
-        f"--- TOOL OUTPUTS ---\n{tool_outputs}\n\n"
-        f"--- ORIGINAL PROJECT DATA ---\n{json.dumps(data.get('projectInformation', {}), indent=2)}\n\n"
-        f"Based ONLY on the tool outputs above, generate the AnalysisReport JSON."
+    final_prompt = REPORT_PROMPT_TEMPLATE.format(
+        tool_outputs=tool_outputs,
+        project_information=project_information
     )
+    messages = [SystemMessage(content=base_prompt), HumanMessage(content=final_prompt)]
+
+    # Identical plan + evidence + prompts + model -> identical report (temperature 0).
+    # Only structured reports built from complete evidence are cached.
+    cacheable = all(timing.get("status", "ok") == "ok" for timing in tool_timings.values())
+    cache_key = report_cache.key(base_prompt + REPORT_PROMPT_TEMPLATE, model, data, tool_outputs)
+    cached = report_cache.get(cache_key) if cacheable else None
+    if cached is not None:
+        print("♻️  Reusing cached report (plan and evidence unchanged)")
+        tool_timings["llm"] = {"seconds": 0.0, "status": "cached"}
+        return {**cached, "evidence_timings": tool_timings}
     
     # 3. Call LLM (Single Shot)
     print("🚀 Calling LLM (Single API Request)...")
-    llm = init_llm()
     structured_llm = llm.with_structured_output(AnalysisReport)
+    start = time.perf_counter()
     
     try:
          # Some models/providers might not support with_structured_output well, 
          # but langchain-google-genai and groq recent versions usually do.
          # If not, we fall back to raw prompting.
-         report = structured_llm.invoke([
-             SystemMessage(content=base_prompt),
-             HumanMessage(content=final_prompt)
-         ])
-         
-         print("\n✅ REPORT GENERATED:")
-         print(json.dumps(report.model_dump(), indent=2))
-         
-         with open("analysis_report.json", "w") as f:
-             f.write(json.dumps(report.model_dump(), indent=2))
+         if rate_limiter:
+             rate_limiter.acquire()
+         report = structured_llm.invoke(messages).model_dump()
+         tool_timings["llm"] = {"seconds": round(time.perf_counter() - start, 3), "status": "ok"}
+         if cacheable:
+             # Structured output carries no usage metadata, so tokens are estimated
+             report_cache.put(cache_key, report, model, estimate_tokens(base_prompt, final_prompt, json.dumps(report)))
+         return {**report, "evidence_timings": tool_timings}
              
     except Exception as e:
         print(f"❌ LLM Call Failed: {e}")
         # Fallback to raw string if structured fails
         print("   (Attempting raw output...)")
-        raw_res = llm.invoke([SystemMessage(content=base_prompt), HumanMessage(content=final_prompt)])
-        print(raw_res.content)
+        if rate_limiter:
+            rate_limiter.acquire()
+        raw_res = llm.invoke(messages)
+        tool_timings["llm"] = {"seconds": round(time.perf_counter() - start, 3), "status": "raw"}
+        return {"raw_report": raw_res.content, "evidence_timings": tool_timings}
+
+def run_single_shot_analysis():
+    # Load Input
+    try:
+        with open("input2.json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        print("❌ input2.json not found.")
+        return
+
+    result = analyze_plan(data, init_llm(), load_system_prompt())
+    if "raw_report" in result:
+        print(result["raw_report"])
+        return
+
+    print("\n✅ REPORT GENERATED:")
+    print(json.dumps(result, indent=2))
+    with open("analysis_report.json", "w") as f:
+        f.write(json.dumps(result, indent=2))
+    print(f"📊 Report cache: {report_cache.stats()}")
+
+def run_batch_analysis(plans_dir: str, results_dir: str, workers: int):
+    """Audits every plan JSON in a directory (see batch_audit.run_batch); resumable."""
+    llm = init_llm()
+    base_prompt = load_system_prompt()
+    if isinstance(llm, LLMRouter):
+        # Rate-limit each backend separately, at the point the router actually calls it
+        llm.before_call = lambda provider: rate_limiter_for(provider).acquire()
+        rate_limiter = None
+    else:
+        rate_limiter = rate_limiter_for(os.getenv("LLM_PROVIDER", "gemini").lower())
+
+    rows = run_batch(
+        plans_dir,
+        lambda data: analyze_plan(data, llm, base_prompt, rate_limiter),
+        results_dir=results_dir,
+        max_workers=workers
+    )
+    print("\n" + format_summary(rows))
+    print(f"📊 Report cache: {report_cache.stats()}")
+    if isinstance(llm, LLMRouter):
+        print(f"🔀 LLM router: {llm.stats()}")
+    print(f"\n📄 Per-plan results and summary.csv written to {results_dir}")
 
 if __name__ == "__main__":
-    run_single_shot_analysis()
+    parser = argparse.ArgumentParser(description="PM-AJAY plan scrutiny (input2.json, or a directory of plans)")
+    parser.add_argument("--plans", help="Directory of plan JSON files to audit in batch")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_DIR, help="Checkpoint / output directory for --plans")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Plans audited concurrently")
+    args = parser.parse_args()
+
+    if args.plans:
+        run_batch_analysis(args.plans, args.results, args.workers)
+    else:
+        run_single_shot_analysis()
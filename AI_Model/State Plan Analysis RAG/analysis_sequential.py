@@ -1,36 +1,20 @@
 import json
-import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from tools import check_financial_compliance, check_scheme_overlap, verify_vision_alignment, parse_currency
+from tools import check_financial_compliance, overlap_evidence, vision_evidence, parse_currency, gather_evidence, format_timings
+from rag_system import format_context
+from report_cache import report_cache, model_id, usage_tokens
+from prompt_assembly import assemble_evidence, truncate_to_tokens, DESCRIPTION_TOKEN_CAP
+from llm_router import llm_from_env
 
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile", 
-    temperature=0,
-    api_key=os.getenv("GROQ_API_KEY") 
-)
+# Groq unless LLM_PROVIDER / LLM_PROVIDERS say otherwise
+llm = llm_from_env(default_provider="groq")
 
-def run_scrutiny_audit(plan_dict: dict):
-    plan_str = json.dumps(plan_dict)
-    
-    print("   1. Running Financial Check...")
-    financial_report = check_financial_compliance.invoke(plan_str)
-
-    print("   2. Extracting Keywords for Overlap Check...")
-    project_title = plan_dict.get("projectInformation", {}).get("title", "")
-    interventions = ", ".join(plan_dict.get("interventionTypes", []))
-    
-    print("   3. Running Scheme Overlap Check...")
-    overlap_report = check_scheme_overlap.invoke(f"{project_title} {interventions}")
-
-    print("   4. Running Vision Alignment Check...")
-    vision_report = verify_vision_alignment.invoke(project_title)
-
-    final_prompt = f"""
+AUDIT_PROMPT_TEMPLATE = """
     You are the Principal Scrutiny Officer. Write a Strict Audit Report based on the following Evidence.
 
     --- EVIDENCE 1: FINANCIAL COMPLIANCE ---
@@ -43,7 +27,7 @@ def run_scrutiny_audit(plan_dict: dict):
     {vision_report}
 
     --- ORIGINAL PLAN ---
-    {plan_dict['projectInformation']['description']}
+    {description}
 
     **INSTRUCTIONS:**
     1. If Financials failed, REJECT the proposal immediately.
@@ -51,10 +35,69 @@ def run_scrutiny_audit(plan_dict: dict):
     3. Be concise and professional.
     """
 
-    print("   5. Generating Final Report...")
-    response = llm.invoke(final_prompt)
+def run_scrutiny_audit(plan_dict: dict, on_event=None):
+    """
+    Evidence checks, then one LLM call for the report.
+    The report is reused from the report cache when the plan and all evidence are unchanged.
+    `on_event("evidence", {...})` is called as each evidence check finishes (used to stream progress).
+    """
+    plan_str = json.dumps(plan_dict)
+    
+    print("   1. Extracting Keywords for Overlap Check...")
+    project_title = plan_dict.get("projectInformation", {}).get("title", "")
+    interventions = ", ".join(plan_dict.get("interventionTypes", []))
+
+    # The checks are independent, so they run concurrently (each with its own timeout)
+    def stream_result(name, entry):
+        output = entry["output"]
+        on_event("evidence", {"name": name, **entry,
+                              "output": output if isinstance(output, str) else format_context(output)})
+
+    print("   2. Running Financial, Scheme Overlap and Vision Alignment Checks...")
+    evidence = gather_evidence({
+        "financial": lambda: check_financial_compliance.invoke(plan_str),
+        "overlap": lambda: overlap_evidence(f"{project_title} {interventions}"),
+        "vision": lambda: vision_evidence([project_title])
+    }, on_result=stream_result if on_event else None)
+
+    # Retrieved chunks are deduplicated across checks and fitted to the model's prompt budget
+    model = model_id(llm)
+    description = truncate_to_tokens(plan_dict['projectInformation']['description'], DESCRIPTION_TOKEN_CAP)
+    sections, prompt_stats = assemble_evidence(
+        {name: entry["output"] for name, entry in evidence.items()},
+        model,
+        reserved_text=AUDIT_PROMPT_TEMPLATE + description
+    )
+
+    final_prompt = AUDIT_PROMPT_TEMPLATE.format(
+        financial_report=sections["financial"],
+        overlap_report=sections["overlap"],
+        vision_report=sections["vision"],
+        description=description
+    )
+
+    # Only reports built from complete evidence are cached: a timed-out check must not stick
+    cacheable = all(entry["status"] == "ok" for entry in evidence.values())
+    cache_key = report_cache.key(AUDIT_PROMPT_TEMPLATE, model, plan_dict, sections)
+    start = time.perf_counter()
+    report = report_cache.get(cache_key) if cacheable else None
+
+    if report is not None:
+        print("   3. Reusing Cached Report (plan and evidence unchanged)...")
+        llm_status = "cached"
+    else:
+        print("   3. Generating Final Report...")
+        response = llm.invoke(final_prompt)
+        report = response.content
+        llm_status = "ok"
+        if cacheable:
+            report_cache.put(cache_key, report, model, usage_tokens(response, final_prompt))
+    llm_seconds = round(time.perf_counter() - start, 3)
     
-    return response.content
+    return (f"{report}\n\n--- EVIDENCE TIMINGS ---\n{format_timings(evidence)}\n"
+            f"- llm: {llm_seconds}s ({llm_status})\n"
+            f"- prompt: ~{prompt_stats['prompt_tokens_after']} tokens "
+            f"(saved ~{prompt_stats['prompt_tokens_saved']} by evidence assembly)")
 
 # --- EXECUTION ---
 if __name__ == "__main__":
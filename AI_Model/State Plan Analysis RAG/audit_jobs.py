@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+AUDIT_WORKERS = int(os.getenv("AUDIT_WORKERS", "2"))              # audits running at once
+AUDIT_QUEUE_LIMIT = int(os.getenv("AUDIT_QUEUE_LIMIT", "16"))     # audits waiting for a worker
+AUDIT_JOB_HISTORY = int(os.getenv("AUDIT_JOB_HISTORY", "200"))    # finished jobs kept for lookup
+
+TERMINAL_EVENTS = ("report", "error")
+
+class AuditQueueFull(Exception):
+    pass
+
+class AuditJob:
+    """
+    One submitted audit and the events it has produced so far
+    ("started", one "evidence" per check, then "report" or "error").
+
+    Events are published on the event loop thread, so the job's fields are only
+    ever changed there; late subscribers get the full history replayed.
+    """
+
+    def __init__(self, job_id: str, loop: asyncio.AbstractEventLoop):
+        self.job_id = job_id
+        self.loop = loop
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self.report = None
+        self.error = None
+        self.done = loop.create_future()
+        self._subscribers = []
+
+    def emit(self, event: str, data: dict):
+        """Thread-safe: called from the worker running the audit."""
+        self.loop.call_soon_threadsafe(self._publish, event, data)
+
+    def _publish(self, event: str, data: dict):
+        if event == "started":
+            self.status = "running"
+            self.started_at = time.time()
+        elif event in TERMINAL_EVENTS:
+            self.status = "done" if event == "report" else "failed"
+            self.finished_at = time.time()
+            self.report = data.get("report")
+            self.error = data.get("error")
+
+        self.events.append((event, data))
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+        # Last, and only if no waiter cancelled it: streams must get the event regardless
+        if event in TERMINAL_EVENTS and not self.done.done():
+            self.done.set_result(None)
+
+    async def stream(self):
+        """Yields (event, data) from the start of the job until its report or error."""
+        queue = asyncio.Queue()
+        for item in self.events:
+            queue.put_nowait(item)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event in TERMINAL_EVENTS:
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "evidence": [data for event, data in self.events if event == "evidence"],
+            "report": self.report,
+            "error": self.error
+        }
+
+class AuditJobManager:
+    """
+    Runs audits on a bounded thread pool, off the event loop.
+    At most `max_workers` audits run at once and `max_pending` more may wait;
+    beyond that submit() raises AuditQueueFull.
+    """
+
+    def __init__(self, run_audit, max_workers: int = AUDIT_WORKERS,
+                 max_pending: int = AUDIT_QUEUE_LIMIT, history: int = AUDIT_JOB_HISTORY):
+        self.run_audit = run_audit  # run_audit(plan, on_event) -> report text
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="audit")
+        self.jobs = OrderedDict()
+
+    def _unfinished(self):
+        return [job for job in self.jobs.values() if job.finished_at is None]
+
+    def submit(self, plan: dict) -> AuditJob:
+        """Must be called from the event loop thread."""
+        if len(self._unfinished()) >= self.max_workers + self.max_pending:
+            raise AuditQueueFull(f"{self.max_workers} audits running and {self.max_pending} queued")
+
+        job = AuditJob(uuid.uuid4().hex, asyncio.get_running_loop())
+        self.jobs[job.job_id] = job
+        self._prune()
+        self.pool.submit(self._run, job, plan)
+        return job
+
+    def _run(self, job: AuditJob, plan: dict):
+        job.emit("started", {})
+        try:
+            report = self.run_audit(plan, on_event=job.emit)
+            job.emit("report", {"report": report})
+        except Exception as e:
+            job.emit("error", {"error": str(e)})
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> AuditJob:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> dict:
+        unfinished = self._unfinished()
+        running = sum(1 for job in unfinished if job.status == "running")
+        return {
+            "workers": self.max_workers,
+            "running": running,
+            "queued": len(unfinished) - running,
+            "queue_limit": self.max_pending
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,165 @@
+import os
+import csv
+import glob
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_RESULTS_DIR = "./audit_results"
+DEFAULT_WORKERS = 4
+# LLM requests per minute allowed per provider (0 = unlimited); LLM_REQUESTS_PER_MINUTE overrides
+PROVIDER_RATE_LIMITS = {"groq": 30, "gemini": 15, "ollama": 0}
+SUMMARY_FILE = "summary.csv"
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate_per_minute` tokens refill continuously, up to `burst`.
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute // 10))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class _Unlimited:
+    def acquire(self):
+        pass
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def rate_limiter_for(provider: str):
+    """One shared bucket per LLM provider, however many workers call it."""
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            rate = float(os.getenv("LLM_REQUESTS_PER_MINUTE", PROVIDER_RATE_LIMITS.get(provider, 0)))
+            _rate_limiters[provider] = TokenBucket(rate) if rate > 0 else _Unlimited()
+        return _rate_limiters[provider]
+
+def _plan_hash(data: dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _write_json_atomic(path: str, payload: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _summary_row(name: str, checkpoint: dict, resumed: bool) -> Dict:
+    result = checkpoint.get("result") or {}
+    if checkpoint.get("error"):
+        status = "error"
+    else:
+        status = result.get("overall_status", "unstructured")
+    return {
+        "plan": name,
+        "title": result.get("project_title", ""),
+        "status": status,
+        "score": result.get("compliance_score", ""),
+        "seconds": checkpoint.get("seconds", ""),
+        "resumed": resumed,
+        "error": checkpoint.get("error") or ""
+    }
+
+def run_batch(
+    plans_dir: str,
+    audit_plan: Callable[[dict], dict],
+    results_dir: str = DEFAULT_RESULTS_DIR,
+    max_workers: int = DEFAULT_WORKERS
+) -> List[Dict]:
+    """
+    Audits every *.json plan in `plans_dir` with `audit_plan(data) -> result dict`.
+
+    Each finished plan is checkpointed to results_dir/<plan>.json together with the
+    hash of the plan it was computed from. A re-run skips plans whose checkpoint
+    matches the current plan content and re-audits new, edited or failed ones, so an
+    interrupted run resumes where it stopped. Returns one summary row per plan and
+    writes the same rows to results_dir/summary.csv.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    plan_paths = sorted(glob.glob(os.path.join(plans_dir, "*.json")))
+    print(f"📂 Found {len(plan_paths)} plans in {plans_dir}")
+
+    rows = {}
+    pending = {}
+    for path in plan_paths:
+        name = os.path.basename(path)
+        checkpoint_path = os.path.join(results_dir, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            rows[name] = _summary_row(name, {"error": f"Unreadable plan: {e}"}, resumed=False)
+            continue
+
+        plan_hash = _plan_hash(data)
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("plan_hash") == plan_hash and not checkpoint.get("error"):
+                rows[name] = _summary_row(name, checkpoint, resumed=True)
+                continue
+        pending[name] = (data, plan_hash, checkpoint_path)
+
+    print(f"⏭️  {len(rows)} plans already done, {len(pending)} to audit on {max_workers} workers")
+
+    def audit(name, data, plan_hash, checkpoint_path):
+        start = time.perf_counter()
+        checkpoint = {"plan": name, "plan_hash": plan_hash, "result": None, "error": None}
+        try:
+            checkpoint["result"] = audit_plan(data)
+        except Exception as e:
+            checkpoint["error"] = str(e)
+        checkpoint["seconds"] = round(time.perf_counter() - start, 2)
+        checkpoint["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        _write_json_atomic(checkpoint_path, checkpoint)
+        return name, checkpoint
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [pool.submit(audit, name, *args) for name, args in pending.items()]
+        for done, future in enumerate(as_completed(futures), 1):
+            name, checkpoint = future.result()
+            rows[name] = _summary_row(name, checkpoint, resumed=False)
+            print(f"✅ [{done}/{len(futures)}] {name}: {rows[name]['status']} {rows[name]['score']}")
+    finally:
+        # On Ctrl-C, plans not yet started are dropped; running ones finish and are checkpointed
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    ordered = [rows[os.path.basename(path)] for path in plan_paths if os.path.basename(path) in rows]
+    with open(os.path.join(results_dir, SUMMARY_FILE), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["plan", "title", "status", "score", "seconds", "resumed", "error"])
+        writer.writeheader()
+        writer.writerows(ordered)
+    return ordered
+
+def format_summary(rows: List[Dict]) -> str:
+    """Fixed-width table of plan, status and score."""
+    width = max([len(row["plan"]) for row in rows] + [4])
+    lines = [f"{'PLAN':<{width}}  {'STATUS':<15}  {'SCORE':>5}  {'SECONDS':>8}"]
+    for row in rows:
+        seconds = "resumed" if row["resumed"] else row["seconds"]
+        lines.append(f"{row['plan']:<{width}}  {row['status']:<15}  {str(row['score']):>5}  {str(seconds):>8}")
+    counts = {}
+    for row in rows:
+        counts[row["status"]] = counts.get(row["status"], 0) + 1
+    lines.append(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+    return "\n".join(lines)
@@ -0,0 +1,220 @@
+import re
+import json
+import time
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+COMPONENTS = ("skill", "infrastructure", "income", "admin")
+# PM-AJAY budget rules: component share of the total grant, in percent
+RULES = {
+    "skill": (">=", 10),
+    "infrastructure": ("<=", 30),
+    "admin": ("<=", 4),
+}
+RULE_LABELS = {"skill": "Skill Dev", "infrastructure": "Infrastructure", "admin": "Admin"}
+NON_AMOUNT = re.compile(r"[^0-9.]")  # anything but ASCII digits and '.' (e.g. '₹' and ',')
+PARSE_CHUNK = 100_000                # strings per code-point matrix while parsing
+INT64_LIMIT = 2.0 ** 63              # totals at or above this cannot be held as int64
+
+def flatten_plans(plans: List[Dict]) -> Tuple[pd.DataFrame, Dict[int, str]]:
+    """
+    One pass over the nested plan JSON into a columnar line-item table:
+    plan (index into `plans`), component, year, raw amount string and count
+    (beneficiaries for income generation, 1 otherwise). Amounts are not parsed here.
+    Returns (line items, {plan: error}) for plans whose structure could not be read.
+    """
+    plan_col, component_col, year_col, raw_col, count_col = [], [], [], [], []
+    columns = (plan_col, component_col, year_col, raw_col, count_col)
+    errors = {}
+
+    # Column lists rather than row tuples: no per-row objects for the garbage collector to track
+    def add(index, component, year, raw, count=1):
+        plan_col.append(index); component_col.append(component); year_col.append(year)
+        raw_col.append(raw); count_col.append(count)
+
+    for index, data in enumerate(plans):
+        start = len(plan_col)
+        try:
+            # 1. Skill Costs
+            if data.get("skillDevelopment", {}).get("isActive"):
+                for year, details in data["skillDevelopment"].get("sectionByYear", {}).items():
+                    for beneficiary in details.get("beneficiaryBreakup", []):
+                        add(index, 0, year, beneficiary.get("fundsProposedGrantInAid", "0"))
+
+            # 2. Infrastructure Costs
+            if data.get("infrastructureDevelopment", {}).get("isActive"):
+                for year, details in data["infrastructureDevelopment"].get("sectionByYear", {}).items():
+                    add(index, 1, year, details.get("otherSchemeFunds", {}).get("fundsFromGrantInAid", "0"))
+
+            # 3. Income Gen (grant per beneficiary x beneficiaries)
+            if data.get("incomeGeneration", {}).get("isActive"):
+                for year, details in data["incomeGeneration"].get("sectionByYear", {}).items():
+                    add(index, 2, year, details.get("financials", {}).get("grantInAid", "0"),
+                        details.get("beneficiaries", 0))
+
+            # 4. Admin Costs
+            for year, details in data.get("adminCosts", {}).items():
+                add(index, 3, year, details.get("adminExpenseAmount", "0"))
+        except (AttributeError, TypeError, KeyError) as e:
+            # Malformed section: drop this plan's partial rows, keep going with the rest
+            for column in columns:
+                del column[start:]
+            errors[index] = f"Malformed plan section: {str(e)}"
+
+    items = pd.DataFrame({
+        "plan": np.asarray(plan_col, dtype=np.int64),
+        "component": pd.Categorical.from_codes(np.asarray(component_col, dtype=np.int8), COMPONENTS),
+        "year": year_col,
+        "raw_amount": pd.Series(raw_col, dtype=object),
+        "count": pd.Series(count_col, dtype=object)
+    })
+    return items, errors
+
+def _parse_unique_amounts(texts: np.ndarray) -> np.ndarray:
+    """
+    parse_currency over an array of strings without a Python-level loop: the strings are
+    viewed as a (n, width) matrix of code points, everything but ASCII digits and '.' is
+    ignored, and the integer part is the digits before the first '.' weighted by powers of 10.
+    """
+    values = np.empty(len(texts), dtype=np.float64)
+    for start in range(0, len(texts), PARSE_CHUNK):
+        block = texts[start:start + PARSE_CHUNK]
+        width = max(block.dtype.itemsize // 4, 1)
+        codes = block.view(np.uint32).reshape(len(block), width)
+        is_digit = (codes >= 48) & (codes <= 57)
+        is_dot = codes == 46
+        dots = is_dot.sum(axis=1)
+        first_dot = np.where(dots > 0, is_dot.argmax(axis=1), width)
+        int_digit = is_digit & (np.arange(width)[None, :] < first_dot[:, None])
+        exponent = int_digit[:, ::-1].cumsum(axis=1)[:, ::-1] - 1
+        digits = np.where(int_digit, codes.astype(np.float64) - 48, 0.0)
+        parsed = (digits * np.power(10.0, np.maximum(exponent, 0))).sum(axis=1)
+        # float() rejects '1.2.3' and a lone '.'
+        invalid = (dots > 1) | ((dots == 1) & ~is_digit.any(axis=1))
+        values[start:start + len(block)] = np.where(invalid, np.nan, parsed)
+    return values
+
+def parse_amounts(raw) -> np.ndarray:
+    """
+    Vectorized parse_currency: '₹4,20,000' -> 420000.0 (fractions truncated).
+    Non-string values count as 0, as in parse_currency; strings that are not a number
+    once cleaned (e.g. '1.2.3') give NaN. Each distinct string is parsed once.
+    """
+    codes, uniques = pd.factorize(pd.Series(raw, dtype=object), use_na_sentinel=False)
+    texts = np.array([value if isinstance(value, str) else "" for value in uniques], dtype=str)
+    return _parse_unique_amounts(texts)[codes]
+
+def _int_or_nan(value) -> float:
+    try:
+        return float(int(value))
+    except (TypeError, ValueError, OverflowError):
+        return np.nan
+
+def _parse_counts(raw) -> np.ndarray:
+    """
+    int(beneficiaries) per line item, each distinct value converted once. Anything int()
+    refuses ('12.5', '1e3', None) is NaN, i.e. a Calculation Error, as in the per-plan check.
+    """
+    codes, uniques = pd.factorize(pd.Series(raw, dtype=object), use_na_sentinel=False)
+    return np.array([_int_or_nan(value) for value in uniques], dtype=np.float64)[codes]
+
+def evaluate_plans(plans: List[Dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Financial compliance for many plans at once.
+
+    Returns (results, items):
+    - results: one row per plan with <component>_total, grand_total, <rule>_pct,
+      <rule>_pass, compliant and error (None when the plan could be evaluated)
+    - items: the line-item table (plan, component, year, amount)
+    """
+    items, errors = flatten_plans(plans)
+    n = len(plans)
+
+    counts = _parse_counts(items.pop("count"))
+    amounts = parse_amounts(items.pop("raw_amount")) * counts
+    invalid = np.isnan(amounts)
+    for plan in np.unique(items["plan"].to_numpy()[invalid]):
+        errors.setdefault(int(plan), "Could not parse an amount or beneficiary count")
+    items["amount"] = np.where(invalid, 0.0, amounts)
+
+    # (plan, component) totals in one bincount
+    codes = items["plan"].to_numpy() * len(COMPONENTS) + items["component"].cat.codes.to_numpy()
+    totals = np.bincount(codes, weights=items["amount"].to_numpy(), minlength=n * len(COMPONENTS))
+    totals = totals.reshape(n, len(COMPONENTS))
+    # Totals are reported as int64; a plan whose grand total would not fit is an error, not a wrap
+    too_large = totals.sum(axis=1) >= INT64_LIMIT
+    for plan in np.flatnonzero(too_large):
+        errors.setdefault(int(plan), "Amounts too large to total")
+    totals = np.where(too_large[:, None], 0.0, totals).astype(np.int64)
+    grand_total = totals.sum(axis=1)
+
+    results = pd.DataFrame({f"{component}_total": totals[:, i] for i, component in enumerate(COMPONENTS)})
+    results["grand_total"] = grand_total
+    compliant = np.ones(n, dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for component, (op, limit) in RULES.items():
+            pct = results[f"{component}_total"].to_numpy() / grand_total * 100
+            passed = pct >= limit if op == ">=" else pct <= limit
+            results[f"{component}_pct"] = pct
+            results[f"{component}_pass"] = passed
+            compliant &= passed
+
+    error = np.full(n, None, dtype=object)
+    error[grand_total == 0] = "Total Project Cost is 0. Check JSON."
+    for plan, message in errors.items():
+        error[plan] = message
+    results["compliant"] = compliant & np.fromiter((message is None for message in error), dtype=bool, count=n)
+    results["error"] = pd.Series(error, dtype=object)
+    return results, items
+
+def year_component_table(items: pd.DataFrame, plan: int) -> pd.DataFrame:
+    """Amounts of one plan as a year x component table."""
+    return items[items["plan"] == plan].pivot_table(
+        index="year", columns="component", values="amount", aggfunc="sum", fill_value=0, observed=False
+    )
+
+def format_compliance_report(result) -> str:
+    """The check_financial_compliance text for one row of evaluate_plans() results."""
+    error = result["error"]
+    if isinstance(error, str):
+        if error == "Total Project Cost is 0. Check JSON.":
+            return f"Error: {error}"
+        return f"Calculation Error: {error}"
+
+    report = [f"Total Budget: ₹{result['grand_total']}"]
+    for component, (op, limit) in RULES.items():
+        label, pct = RULE_LABELS[component], result[f"{component}_pct"]
+        if result[f"{component}_pass"]:
+            report.append(f"✅ {label}: {pct:.2f}% (Pass)")
+        else:
+            report.append(f"❌ {label}: {pct:.2f}% (Fail, needs {op}{limit}%)")
+    return "\n".join(report)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk financial compliance check over copies of a plan")
+    parser.add_argument("--input", default="input2.json")
+    parser.add_argument("--plans", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        template = json.load(f)
+    # Independent copies with varied admin costs, so plans differ in compliance
+    template_json = json.dumps(template)
+    rng = np.random.default_rng(0)
+    plans = []
+    for scale in rng.integers(0, 30, size=args.plans):
+        plan = json.loads(template_json)
+        for details in plan.get("adminCosts", {}).values():
+            details["adminExpenseAmount"] = f"₹{scale},00,000"
+        plans.append(plan)
+
+    start = time.perf_counter()
+    results, items = evaluate_plans(plans)
+    seconds = time.perf_counter() - start
+    passes = ", ".join(f"{component} {int(results[f'{component}_pass'].sum())}" for component in RULES)
+    print(f"{len(plans)} plans, {len(items)} line items in {seconds:.2f}s ({len(plans) / seconds:,.0f} plans/s)")
+    print(f"Rule passes: {passes}; fully compliant: {int(results['compliant'].sum())}")
+    print(format_compliance_report(results.iloc[0]))
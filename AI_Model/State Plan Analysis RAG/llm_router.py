@@ -0,0 +1,307 @@
+import os
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Optional
+
+ROLLING_WINDOW = 50          # recent calls per provider used for latency / error rate
+MIN_SAMPLES = 5              # calls before a provider's latency is trusted (ranking and hedging)
+MAX_ERROR_RATE = 0.5         # above this a provider is unhealthy ...
+UNHEALTHY_COOLDOWN = 30.0    # ... until this many seconds after its last failure
+PROBE_INTERVAL = 20          # every Nth request goes to another healthy provider, keeping its latency current
+HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9"))  # 0 disables hedging
+
+DEFAULT_MODELS = {
+    "groq": "llama-3.3-70b-versatile",
+    "gemini": "gemini-1.5-flash",
+    "ollama": "llama3.1",
+}
+
+def make_provider(name: str):
+    """
+    Chat model for a provider name: groq, gemini, ollama, or stub:<seconds> for a local
+    stand-in with that median latency (no network, for tests and benchmarks).
+    """
+    if name == "groq":
+        from langchain_groq import ChatGroq
+        return ChatGroq(
+            model=DEFAULT_MODELS["groq"], temperature=0,
+            api_key=os.getenv("GROQ_API_KEY"), max_retries=2
+        )
+    elif name == "ollama":
+        from langchain_ollama import ChatOllama
+        return ChatOllama(model=os.getenv("OLLAMA_MODEL", DEFAULT_MODELS["ollama"]), temperature=0)
+    elif name == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=DEFAULT_MODELS["gemini"], temperature=0, max_retries=2)
+    elif name.startswith("stub:"):
+        return StubProvider(name, latency=float(name.split(":", 1)[1]))
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+
+def llm_from_env(default_provider: str):
+    """
+    LLM_PROVIDERS="groq,gemini" -> an LLMRouter over those providers;
+    otherwise the single LLM_PROVIDER (or `default_provider`).
+    """
+    providers = [name.strip().lower() for name in os.getenv("LLM_PROVIDERS", "").split(",") if name.strip()]
+    if providers:
+        print(f"🧠 Initializing LLM Router over: {', '.join(providers)}")
+        return LLMRouter({name: make_provider(name) for name in providers})
+    provider = os.getenv("LLM_PROVIDER", default_provider).lower()
+    print(f"🧠 Initializing LLM Backend: {provider.upper()}")
+    return make_provider(provider)
+
+class _StubMessage:
+    def __init__(self, content: str):
+        self.content = content
+        self.usage_metadata = None
+
+class StubProvider:
+    """
+    Local stand-in for a chat model: log-normal latency around `latency` seconds and a
+    failure probability. Supports invoke() and with_structured_output() like the real ones.
+    """
+
+    def __init__(self, name: str, latency: float, jitter: float = 0.5, error_rate: float = 0.0,
+                 seed: Optional[int] = None, schema=None):
+        self.model_name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.schema = schema
+        self._random = random.Random(seed)
+
+    def invoke(self, input, **kwargs):
+        time.sleep(self.latency * self._random.lognormvariate(0, self.jitter))
+        if self._random.random() < self.error_rate:
+            raise RuntimeError("simulated provider error")
+        if self.schema is not None:
+            return self.schema.model_construct()
+        return _StubMessage(f"[{self.model_name}] report for a prompt of {len(str(input))} chars")
+
+    def with_structured_output(self, schema, **kwargs):
+        stub = StubProvider(self.model_name, self.latency, self.jitter, self.error_rate, schema=schema)
+        stub._random = self._random
+        return stub
+
+class ProviderStats:
+    """Rolling latency and error rate of one provider (thread-safe)."""
+
+    def __init__(self, window: int = ROLLING_WINDOW):
+        self.calls = deque(maxlen=window)   # (seconds, ok)
+        self.total_calls = 0
+        self.total_errors = 0
+        self.last_failure = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self.calls.append((seconds, ok))
+            self.total_calls += 1
+            if not ok:
+                self.total_errors += 1
+                self.last_failure = time.monotonic()
+
+    def latency(self, quantile: float) -> Optional[float]:
+        """Latency quantile of recent successful calls, or None with too few samples."""
+        with self._lock:
+            latencies = sorted(seconds for seconds, ok in self.calls if ok)
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return sum(1 for _, ok in self.calls if not ok) / len(self.calls) if self.calls else 0.0
+
+    def healthy(self) -> bool:
+        if self.error_rate() <= MAX_ERROR_RATE:
+            return True
+        # Unhealthy providers get probed again once the cooldown has passed
+        return self.last_failure is None or time.monotonic() - self.last_failure > UNHEALTHY_COOLDOWN
+
+    def summary(self) -> Dict:
+        p50, p90 = self.latency(0.5), self.latency(0.9)
+        return {
+            "calls": self.total_calls,
+            "errors": self.total_errors,
+            "error_rate": round(self.error_rate(), 3),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p90": round(p90, 3) if p90 is not None else None,
+            "healthy": self.healthy()
+        }
+
+class LLMRouter:
+    """
+    Chat-model facade over several providers (invoke / with_structured_output).
+
+    Each request goes to the healthy provider with the lowest recent median latency
+    (providers with too few samples are tried first, so every one gets measured, and
+    every PROBE_INTERVAL-th request re-measures another one).
+    If it has not answered by its own `hedge_quantile` latency, the same request is also
+    sent to the next provider and the first answer wins. A failed call fails over to
+    the next provider. `before_call(provider)` runs before every provider call
+    (e.g. a per-provider rate limiter); the hedge deadline starts once it returns, and
+    calls still waiting in it when the request is answered are skipped.
+    """
+
+    def __init__(self, providers: Dict[str, object], hedge_quantile: float = HEDGE_QUANTILE,
+                 before_call: Optional[Callable[[str], None]] = None, _shared=None):
+        self.providers = providers
+        self.hedge_quantile = hedge_quantile
+        self.before_call = before_call
+        # Report cache / prompt budget identity: any provider of the pool may answer
+        self.model_name = "router[" + ",".join(
+            str(getattr(llm, "model_name", None) or getattr(llm, "model", None) or name)
+            for name, llm in providers.items()
+        ) + "]"
+        if _shared is None:
+            _shared = {
+                "stats": {name: ProviderStats() for name in providers},
+                "counters": {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0},
+                "lock": threading.Lock(),
+                "pool": ThreadPoolExecutor(max_workers=max(4, 4 * len(providers)), thread_name_prefix="llm")
+            }
+        self._shared = _shared
+        self.provider_stats = _shared["stats"]
+
+    def with_structured_output(self, schema, **kwargs):
+        """Same routing, over each provider's structured-output runnable; statistics are shared."""
+        return LLMRouter(
+            {name: llm.with_structured_output(schema, **kwargs) for name, llm in self.providers.items()},
+            self.hedge_quantile, self.before_call, _shared=self._shared
+        )
+
+    def _count(self, counter: str) -> int:
+        with self._shared["lock"]:
+            self._shared["counters"][counter] += 1
+            return self._shared["counters"][counter]
+
+    def ranked(self, request_number: int = 1):
+        """
+        Provider names, best first: healthy ones by median latency, then unhealthy ones.
+        Every PROBE_INTERVAL-th request puts another healthy provider (in rotation) first;
+        otherwise a provider that once measured slow would never be measured again.
+        """
+        def score(name):
+            p50 = self.provider_stats[name].latency(0.5)
+            return 0.0 if p50 is None else p50
+        names = list(self.providers)
+        healthy = sorted((n for n in names if self.provider_stats[n].healthy()), key=score)
+        if len(healthy) > 1 and request_number % PROBE_INTERVAL == 0:
+            probe = 1 + (request_number // PROBE_INTERVAL) % (len(healthy) - 1)
+            healthy.insert(0, healthy.pop(probe))
+        return healthy + [n for n in names if n not in healthy]
+
+    def _call(self, name: str, input, kwargs, started: threading.Event, answered: threading.Event):
+        try:
+            if self.before_call and not answered.is_set():
+                self.before_call(name)
+        finally:
+            started.set()
+        if answered.is_set():
+            # Answered by another provider while this call waited (e.g. on its rate limiter)
+            return None
+        start = time.perf_counter()
+        try:
+            result = self.providers[name].invoke(input, **kwargs)
+        except Exception:
+            self.provider_stats[name].record(time.perf_counter() - start, ok=False)
+            raise
+        self.provider_stats[name].record(time.perf_counter() - start, ok=True)
+        return result
+
+    def invoke(self, input, **kwargs):
+        order = self.ranked(self._count("requests"))
+        answered = threading.Event()
+        pending = {}
+        next_index = 0
+        errors = []
+
+        def launch():
+            nonlocal next_index
+            name = order[next_index]
+            next_index += 1
+            started = threading.Event()
+            pending[self._shared["pool"].submit(self._call, name, input, kwargs, started, answered)] = name
+            return started
+
+        primary_started = launch()
+        hedge_after = self.provider_stats[order[0]].latency(self.hedge_quantile) if self.hedge_quantile > 0 else None
+        if hedge_after is not None:
+            # The hedge deadline counts from the provider call itself, not from time spent
+            # waiting in before_call: a rate-limited primary must not trigger a hedge
+            primary_started.wait()
+        start = time.perf_counter()
+        hedged = False
+
+        while pending:
+            timeout = None
+            if hedge_after is not None and not hedged and next_index < len(order):
+                timeout = max(0.0, start + hedge_after - time.perf_counter())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Primary is slower than its usual p(hedge_quantile): race the next provider
+                print(f"⏱️  {order[0]} slower than {hedge_after:.2f}s, hedging to {order[next_index]}")
+                hedged = True
+                self._count("hedges")
+                launch()
+                continue
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"{name}: {str(e)}")
+                    if not pending and next_index < len(order):
+                        print(f"⚠️  {name} failed ({str(e)}), failing over to {order[next_index]}")
+                        self._count("failovers")
+                        launch()
+                    continue
+                if hedged and name != order[0]:
+                    self._count("hedge_wins")
+                # A call still waiting in before_call is skipped; one already running
+                # finishes in the background and still updates its stats
+                answered.set()
+                return result
+
+        raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+
+    def stats(self) -> Dict:
+        with self._shared["lock"]:
+            counters = dict(self._shared["counters"])
+        return {**counters, "providers": {name: stats.summary() for name, stats in self.provider_stats.items()}}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM router on stub providers: tail latency with and without hedging")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--quantile", type=float, default=0.9)
+    args = parser.parse_args()
+
+    def providers():
+        # A fast provider with a heavy tail, a slower steady one, and a flaky one
+        return {
+            "fast": StubProvider("fast", latency=0.03, jitter=1.2, seed=1),
+            "steady": StubProvider("steady", latency=0.06, jitter=0.2, seed=2),
+            "flaky": StubProvider("flaky", latency=0.04, jitter=0.3, error_rate=0.6, seed=3),
+        }
+
+    for label, quantile in (("no hedging", 0.0), (f"hedge at p{int(args.quantile * 100)}", args.quantile)):
+        router = LLMRouter(providers(), hedge_quantile=quantile)
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            router.invoke("audit prompt")
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        stats = router.stats()
+        print(f"{label}: p50 {pick(0.5) * 1000:.0f}ms, p99 {pick(0.99) * 1000:.0f}ms, "
+              f"hedges {stats['hedges']} (won {stats['hedge_wins']}), failovers {stats['failovers']}")
+        print(f"   {stats['providers']}")
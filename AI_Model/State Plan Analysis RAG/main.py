@@ -1,16 +1,24 @@
 import os
+import asyncio
+import threading
+import json
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 
 # Import your existing RAG system
 from rag_system import PMAjayRAG
-from analysis_sequential import run_scrutiny_audit
+from analysis_sequential import run_scrutiny_audit, llm as audit_llm
+from audit_jobs import AuditJobManager, AuditQueueFull
+from report_cache import report_cache
+from llm_router import LLMRouter
 
 # Global instance
 rag_system: Optional[PMAjayRAG] = None
+audit_jobs: Optional[AuditJobManager] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -18,7 +26,7 @@ async def lifespan(app: FastAPI):
     Lifespan context manager to handle startup and shutdown events.
     Initializes the RAG system only once when the app starts.
     """
-    global rag_system
+    global rag_system, audit_jobs
     print("🚀 Starting PM-AJAY RAG API...")
     try:
         # Initialize RAG (loads embeddings and connects to ChromaDB)
@@ -27,10 +35,15 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"❌ Failed to initialize RAG System: {e}")
         raise e
+
+    # Audits run on their own bounded pool so LLM calls never block the event loop
+    audit_jobs = AuditJobManager(run_scrutiny_audit)
+    print(f"🧵 Audit workers: {audit_jobs.max_workers} (queue limit {audit_jobs.max_pending})")
     
     yield
     
     print("🛑 Shutting down PM-AJAY RAG API...")
+    audit_jobs.shutdown()
     # Clean up resources if necessary (e.g. close DB connections)
 
 app = FastAPI(
@@ -61,9 +74,22 @@ class QueryResponse(BaseModel):
     context: str
     status: str = "success"
 
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest]
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
+    status: str = "success"
+
+class AuditJobResponse(BaseModel):
+    job_id: str
+    status: str
+    events_url: str
+
 class IngestResponse(BaseModel):
     message: str
     doc_count: int
+    summary: Optional[Dict] = None  # unchanged / new / changed / removed files, chunks added
 
 # --- Endpoints ---
 
@@ -71,14 +97,17 @@ class IngestResponse(BaseModel):
 async def health_check():
     """Health check endpoint to verify service status."""
     if rag_system and rag_system.vector_db:
-        return {"status": "healthy", "service": "PM-AJAY RAG"}
+        return {"status": "healthy", "service": "PM-AJAY RAG", "audits": audit_jobs.stats() if audit_jobs else None,
+                "report_cache": report_cache.stats(),
+                "llm_router": audit_llm.stats() if isinstance(audit_llm, LLMRouter) else None}
     return {"status": "unhealthy", "reason": "RAG System not initialized"}
 
 @app.post("/query", response_model=QueryResponse)
-async def query_knowledge_base(request: QueryRequest):
+def query_knowledge_base(request: QueryRequest):
     """
     Semantic search endpoint.
     Returns: Relevant text chunks formatted as context.
+    A plain def, like /query/batch: embedding and search block, so it runs in the threadpool.
     """
     if not rag_system:
         raise HTTPException(status_code=503, detail="RAG System not initialized")
@@ -98,39 +127,114 @@ async def query_knowledge_base(request: QueryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
 
+@app.post("/query/batch", response_model=BatchQueryResponse)
+def query_knowledge_base_batch(request: BatchQueryRequest):
+    """
+    Batched semantic search: all queries are embedded in one pass and searched together.
+    Each query keeps its own k and filters. Results are returned in request order.
+    A plain def: FastAPI runs it in its threadpool, off the event loop, since
+    embedding and the Chroma search block.
+    """
+    if not rag_system:
+        raise HTTPException(status_code=503, detail="RAG System not initialized")
+
+    try:
+        contexts = rag_system.query_many([
+            {"query": item.query, "k": item.k, "filters": item.filters}
+            for item in request.queries
+        ])
+
+        return BatchQueryResponse(results=[
+            QueryResponse(query=item.query, context=context)
+            for item, context in zip(request.queries, contexts)
+        ])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch query failed: {str(e)}")
+
+_ingest_lock = threading.Lock()
+
 @app.post("/ingest", response_model=IngestResponse)
-async def trigger_ingestion():
+def trigger_ingestion():
     """
     Triggers the document ingestion process (parsing & chunking).
-    This might take a while, so in production, this should be a background task.
+    This might take a while; as a plain def it runs in the threadpool, so /health,
+    queries and audit streams keep being served meanwhile. One ingestion at a time.
     """
     if not rag_system:
         raise HTTPException(status_code=503, detail="RAG System not initialized")
+    if not _ingest_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Ingestion already running")
 
     try:
-        # Re-run ingestion
-        rag_system.ingest_documents()
+        # Re-run ingestion (only new or changed files are parsed)
+        summary = rag_system.ingest_documents()
         
         # Get count
         count = rag_system.vector_db._collection.count()
-        return IngestResponse(message="Ingestion completed successfully", doc_count=count)
+        return IngestResponse(message="Ingestion completed successfully", doc_count=count, summary=summary)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
+    finally:
+        _ingest_lock.release()
+
 
 
+def _submit_audit(plan: Dict):
+    if not audit_jobs:
+        raise HTTPException(status_code=503, detail="Audit workers not initialized")
+    try:
+        return audit_jobs.submit(plan)
+    except AuditQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Audit queue is full: {str(e)}")
 
 @app.post("/analyze", response_model=Dict[str, str])
 async def analyze_project(plan: Dict):
     """
-    Triggers the sequential scrutiny analysis agent.
+    Triggers the scrutiny analysis agent and waits for its report.
+    The audit runs on the audit worker pool, so other requests are served meanwhile.
     Input: Full JSON project plan.
     Output: Audit Report.
     """
-    try:
-        report = run_scrutiny_audit(plan)
-        return {"status": "success", "report": report}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    job = _submit_audit(plan)
+    # Shielded: a cancelled request must not cancel the job's shared future
+    await asyncio.shield(job.done)
+    if job.error is not None:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {job.error}")
+    return {"status": "success", "report": job.report}
+
+@app.post("/analyze/jobs", response_model=AuditJobResponse, status_code=202)
+async def submit_analysis_job(plan: Dict):
+    """
+    Submits an audit as a background job and returns immediately.
+    Follow progress at events_url (server-sent events) or poll /analyze/jobs/{job_id}.
+    """
+    job = _submit_audit(plan)
+    return AuditJobResponse(job_id=job.job_id, status=job.status, events_url=f"/analyze/jobs/{job.job_id}/events")
+
+@app.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """Status, evidence gathered so far and (when done) the report of an audit job."""
+    job = audit_jobs.get(job_id) if audit_jobs else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job.summary()
+
+@app.get("/analyze/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str):
+    """
+    Server-sent events for an audit job: "started", one "evidence" event per check
+    as it finishes, then "report" (or "error"). Earlier events are replayed on connect.
+    """
+    job = audit_jobs.get(job_id) if audit_jobs else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+
+    async def events():
+        async for event, data in job.stream():
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
     # For debugging directly
@@ -0,0 +1,137 @@
+import os
+import hashlib
+from typing import Dict, List, Tuple, Union
+
+from rag_system import format_context
+from report_cache import estimate_tokens
+
+# Prompt token budget per model (whole prompt: instructions, plan and evidence)
+PROMPT_TOKEN_BUDGETS = {
+    "llama-3.3-70b-versatile": 6000,
+    "gemini-1.5-flash": 12000,
+    "llama3.1": 4000,
+}
+DEFAULT_PROMPT_TOKEN_BUDGET = 6000
+DESCRIPTION_TOKEN_CAP = 800   # plan description tokens kept in the prompt
+NO_EVIDENCE = "No relevant documents found in knowledge base."
+
+def token_budget(model: str) -> int:
+    """
+    Budget for a model id like 'ChatGroq:llama-3.3-70b-versatile'; PROMPT_TOKEN_BUDGET overrides.
+    For an LLM router ('LLMRouter:router[a,b]') the prompt must fit whichever model answers,
+    so the smallest budget of the pool applies.
+    """
+    if os.getenv("PROMPT_TOKEN_BUDGET"):
+        return int(os.getenv("PROMPT_TOKEN_BUDGET"))
+    name = model.split(":", 1)[-1]
+    if name.startswith("router[") and name.endswith("]"):
+        return min(token_budget(member) for member in name[len("router["):-1].split(","))
+    return PROMPT_TOKEN_BUDGETS.get(name, DEFAULT_PROMPT_TOKEN_BUDGET)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " [...]"
+
+def _chunk_key(chunk: Dict) -> str:
+    # Chunk ids are stable (relpath#position); the content hash also catches the same
+    # passage ingested from two files
+    normalized = " ".join(chunk["text"].split()).lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def assemble_evidence(
+    sections: Dict[str, Union[List[Dict], str]],
+    model: str,
+    reserved_text: str = ""
+) -> Tuple[Dict[str, str], Dict]:
+    """
+    Prompt assembly for retrieved evidence.
+
+    sections: {name: ranked chunks (best first), or an already formatted string such as a
+    financial report or a failed-check note}. `reserved_text` is everything else that
+    goes into the prompt; only what is left of the model's budget is spent on chunks.
+
+    1. Chunks returned by several tools (same id or same content) are kept once, in the
+       section where they are closest to the query.
+    2. Every section keeps its best chunk; the others are taken round-robin by rank
+       across sections while they fit the token budget.
+    3. Each section is rendered as the tools would have, with only the kept chunks and
+       a note of how many passages were omitted (or quoted under another section).
+       NO_EVIDENCE is only used when retrieval itself found nothing.
+
+    Returns ({name: text}, stats) where stats has chunk counts and prompt token estimates
+    before and after assembly.
+    """
+    entries = [
+        (chunk["distance"], order, rank, name, chunk)
+        for order, (name, chunks) in enumerate(sections.items()) if not isinstance(chunks, str)
+        for rank, chunk in enumerate(chunks)
+    ]
+    entries.sort(key=lambda entry: entry[:3])
+    seen = set()
+    unique = []
+    for _, _, rank, name, chunk in entries:
+        keys = {chunk["id"], _chunk_key(chunk)}
+        if seen.isdisjoint(keys):
+            unique.append((rank, name, chunk))
+        seen |= keys
+
+    per_section = {}
+    for rank, name, chunk in unique:
+        per_section.setdefault(name, []).append((rank, chunk))
+    candidates = []
+    for name, ranked in per_section.items():
+        ranked.sort(key=lambda item: item[0])
+        for position, (_, chunk) in enumerate(ranked):
+            candidates.append((position, chunk["distance"], name, chunk))
+    candidates.sort(key=lambda item: (item[0], item[1]))
+
+    fixed_tokens = estimate_tokens(reserved_text, *[text for text in sections.values() if isinstance(text, str)])
+    remaining = token_budget(model) - fixed_tokens
+    kept = {}
+    for position, _, name, chunk in candidates:
+        cost = estimate_tokens(format_context([chunk]))
+        # Every section keeps its best chunk even over budget; the rest must fit
+        if cost > remaining and position > 0:
+            continue
+        remaining -= cost
+        kept.setdefault(name, []).append(chunk)
+
+    rendered = {}
+    for name, chunks in sections.items():
+        if isinstance(chunks, str):
+            rendered[name] = chunks
+            continue
+        if not chunks:
+            rendered[name] = NO_EVIDENCE
+            continue
+        ranked = sorted(kept.get(name, []), key=lambda chunk: chunk["distance"])
+        omitted = len(per_section.get(name, [])) - len(ranked)
+        shared = len(chunks) - len(per_section.get(name, []))
+        # Say what was left out, so the model never reads a cut section as "no evidence"
+        notes = []
+        if omitted:
+            notes.append(f"({omitted} more relevant passage(s) omitted to fit the prompt budget)")
+        if shared and not ranked:
+            notes.append(f"({shared} relevant passage(s) already quoted under another check)")
+        rendered[name] = "\n\n".join(([format_context(ranked)] if ranked else []) + notes)
+
+    raw_tokens = fixed_tokens + sum(
+        estimate_tokens(format_context(chunks)) for chunks in sections.values() if not isinstance(chunks, str)
+    )
+    assembled_tokens = fixed_tokens + sum(
+        estimate_tokens(text) for name, text in rendered.items() if not isinstance(sections[name], str)
+    )
+    stats = {
+        "chunks": sum(len(chunks) for chunks in sections.values() if not isinstance(chunks, str)),
+        "unique_chunks": len(unique),
+        "kept_chunks": sum(len(chunks) for chunks in kept.values()),
+        "prompt_tokens_before": raw_tokens,
+        "prompt_tokens_after": assembled_tokens,
+        "prompt_tokens_saved": raw_tokens - assembled_tokens,
+        "budget": token_budget(model)
+    }
+    print(f"✂️  Evidence: {stats['chunks']} chunks -> {stats['unique_chunks']} unique -> {stats['kept_chunks']} kept; "
+          f"prompt ~{assembled_tokens} tokens (saved ~{stats['prompt_tokens_saved']}, budget {stats['budget']})")
+    return rendered, stats
@@ -3,17 +3,169 @@ from dotenv import load_dotenv
 
 load_dotenv()
 import glob
-from typing import List, Dict, Optional
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from importlib import metadata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
 
 # Back to Docling
 from docling.document_converter import DocumentConverter
 from docling.chunking import HybridChunker
+from docling_core.types.doc import DoclingDocument
 from transformers import AutoTokenizer
 
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_ollama import OllamaEmbeddings
 from langchain_chroma import Chroma
-from langchain_core.documents import Document
+
+SUPPORTED_EXTENSIONS = (".pdf", ".md")
+CHUNK_TOKENIZER = "sentence-transformers/all-mpnet-base-v2"
+CHUNK_MAX_TOKENS = 384
+MANIFEST_FILE = "ingest_manifest.json"
+PARSED_CACHE_DIR = "./parsed_cache"
+QUERY_EMBEDDING_CACHE_SIZE = 1024   # distinct query texts whose embeddings are kept
+RETRIEVAL_CACHE_SIZE = 512          # distinct (query, k, filters) results kept
+EMBED_BATCH_SIZE = 64       # texts per model forward pass
+UPSERT_BATCH_SIZE = 1024    # chunks per embed_documents call and per Chroma upsert
+
+# Per-process Docling converter and chunker, each created on first use in a worker
+_parse_tools = {}
+
+def _converter_version() -> str:
+    """Parsed documents are only reused while the Docling packages that produced them are unchanged."""
+    versions = []
+    for package in ("docling", "docling-core"):
+        try:
+            versions.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}=unknown")
+    return ";".join(versions)
+
+def _chunking_config(embedding_model_name: str) -> str:
+    """Anything that changes chunk text or vectors without changing the source file."""
+    return f"{CHUNK_TOKENIZER}|{CHUNK_MAX_TOKENS}|{embedding_model_name}"
+
+def _file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _chunk_id(rel_path: str, position: int) -> str:
+    """Deterministic chunk id: re-ingesting a file overwrites its chunks instead of duplicating them."""
+    return f"{rel_path.replace(os.sep, '/')}#{position}"
+
+def _has_text(doc) -> bool:
+    # Stops at the first non-empty item instead of rendering the whole document to markdown
+    return any(item.text.strip() for item in doc.texts) or bool(doc.tables)
+
+def _load_document(file_path: str, file_hash: str, cache_dir: str):
+    """
+    Docling conversion with an on-disk cache keyed by file hash and converter version.
+    Layout parsing only runs for files (or Docling versions) never seen before.
+    """
+    version_key = hashlib.sha256(_converter_version().encode()).hexdigest()[:12]
+    cache_path = os.path.join(cache_dir, f"{file_hash}.{version_key}.json")
+    if os.path.exists(cache_path):
+        print(f"📦 Cached parse: {file_path}")
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return DoclingDocument.model_validate_json(f.read())
+
+    if "converter" not in _parse_tools:
+        _parse_tools["converter"] = DocumentConverter()
+    print(f"📄 Parsing: {file_path}")
+    doc = _parse_tools["converter"].convert(file_path).document
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(doc.model_dump_json())
+    os.replace(tmp_path, cache_path)
+    return doc
+
+def _parse_file(file_path: str, base_meta: Dict, file_hash: str, cache_dir: str = PARSED_CACHE_DIR) -> List[Tuple[str, Dict]]:
+    """
+    Converts one file with Docling (or loads the cached conversion) and chunks it.
+    Runs in an ingestion worker process. Returns (contextualized text, sanitized metadata) per chunk.
+    """
+    if "chunker" not in _parse_tools:
+        _parse_tools["chunker"] = HybridChunker(
+            tokenizer=AutoTokenizer.from_pretrained(CHUNK_TOKENIZER),
+            max_tokens=CHUNK_MAX_TOKENS,
+            merge_peers=True
+        )
+    chunker = _parse_tools["chunker"]
+
+    doc = _load_document(file_path, file_hash, cache_dir)
+
+    # Verify we have text
+    if not _has_text(doc):
+        print(f"⚠️  Warning: No text found in {os.path.basename(file_path)}")
+        return []
+
+    chunks = []
+    for chunk in chunker.chunk(dl_doc=doc):
+        combined_meta = base_meta.copy()
+        if chunk.meta: combined_meta.update(chunk.meta)
+
+        sanitized_meta = {}
+        for k, v in combined_meta.items():
+            if isinstance(v, (str, int, float, bool)):
+                sanitized_meta[k] = v
+            else:
+                sanitized_meta[k] = str(v)
+
+        chunks.append((chunker.contextualize(chunk=chunk), sanitized_meta))
+    return chunks
+
+def format_context(chunks: List[Dict]) -> str:
+    """Retrieved chunks as the '[Source: ... | Type: ...]' context blocks the tools return."""
+    if not chunks:
+        return "No relevant documents found in knowledge base."
+    formatted_context = ""
+    for chunk in chunks:
+        formatted_context += f"\n[Source: {chunk['source']} | Type: {chunk['category']}]\n{chunk['text']}\n"
+    return formatted_context
+
+class _LRUCache:
+    """Small thread-safe LRU map used for query embeddings and retrieval results."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
 
 class PMAjayRAG:
     def __init__(
@@ -21,7 +173,8 @@ class PMAjayRAG:
         docs_path: str = "./documents",
         persist_directory: str = "./chroma_db",
         embedding_model_name: str = "sentence-transformers/all-mpnet-base-v2",  
-        collection_name: str = "pmajay_knowledge_base"
+        collection_name: str = "pmajay_knowledge_base",
+        parsed_cache_dir: str = PARSED_CACHE_DIR
     ):
         """
         Initializes the RAG System.
@@ -29,6 +182,13 @@ class PMAjayRAG:
         self.docs_path = docs_path
         self.persist_directory = persist_directory
         self.collection_name = collection_name
+        self.manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+        self.parsed_cache_dir = parsed_cache_dir
+        self.chunking_config = _chunking_config(embedding_model_name)
+
+        # Tool prompts repeat the same query strings across audits
+        self.query_embedding_cache = _LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+        self.retrieval_cache = _LRUCache(RETRIEVAL_CACHE_SIZE)
         
         print(f"Loading embedding model: {embedding_model_name}...")
         
@@ -40,7 +200,7 @@ class PMAjayRAG:
             self.embedding_function = HuggingFaceEmbeddings(
                 model_name=embedding_model_name,
                 model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
+                encode_kwargs={'normalize_embeddings': True, 'batch_size': EMBED_BATCH_SIZE}
             )
             
         self.vector_db = self._initialize_db()
@@ -107,15 +267,46 @@ class PMAjayRAG:
             if ids:
                 print(f"🗑️  Clearing {len(ids)} documents from existing DB...")
                 self.vector_db.delete(ids=ids)
+                self.invalidate_query_caches()
                 print("✅ Database Cleared.")
             else:
                 print("ℹ️  Database is already empty.")
+            # Nothing is ingested any more: the next run must re-process every file
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
         except Exception as e:
             print(f"⚠️  Error clearing database: {e}")
 
-    def ingest_documents(self):
+    def _load_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest: Dict):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _delete_file_chunks(self, manifest: Dict, rel_path: str):
+        entry = manifest.pop(rel_path, None)
+        if entry and entry.get("ids"):
+            self.vector_db.delete(ids=entry["ids"])
+            self.invalidate_query_caches()
+            print(f"🗑️  Removed {len(entry['ids'])} chunks of {rel_path}")
+
+    def ingest_documents(self, max_workers: Optional[int] = None) -> Dict:
         """
-        Parses PDFs using Docling, chunks them, and adds to DB.
+        Incrementally parses PDFs using Docling, chunks them, and adds them to the DB.
+
+        A manifest of file content hashes (next to the DB) records what is already
+        ingested: unchanged files are skipped, changed files have their old chunks
+        replaced and deleted files have their chunks removed. New and changed files
+        are converted in parallel across a process pool, then all their chunks are
+        embedded in bulk and upserted under ids derived from file and chunk position.
         """
         doc_count = 0
         try:
@@ -123,107 +314,202 @@ class PMAjayRAG:
         except: pass
         print(f"📊 Current DB Count: {doc_count}")
 
-        print("🔧 Initializing Docling Converter & HybridChunker...")
-        converter = DocumentConverter()
-        
-        model_id = "sentence-transformers/all-mpnet-base-v2"
-        tokenizer = AutoTokenizer.from_pretrained(model_id)
-        chunker = HybridChunker(
-            tokenizer=tokenizer,
-            max_tokens=384, 
-            merge_peers=True
-        )
-
         # Walk Directories
         files = []
         for root, dirs, filenames in os.walk(self.docs_path):
             for filename in filenames:
-                files.append(os.path.join(root, filename))
+                if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                    files.append(os.path.join(root, filename))
 
-        if not files:
-            print(f"❌ No files found in {self.docs_path}")
-            return
+        manifest = self._load_manifest()
+        if not manifest and doc_count > 0:
+            # Chunks stored before manifests existed (random ids) or with a lost manifest:
+            # nothing maps them to files, so rebuild rather than add every file on top of them
+            print(f"⚠️  {doc_count} chunks in the DB but no ingest manifest; rebuilding the collection.")
+            self.clear_database()
+            doc_count = 0
+        current = {os.path.relpath(path, self.docs_path): path for path in files}
 
-        print(f"🔍 Found {len(files)} files to process.")
-        
-        all_chunks_for_db = []
-        
-        for file_path in files:
-            if not (file_path.lower().endswith(".pdf") or file_path.lower().endswith(".md")): 
-                continue
-                
-            try:
-                print(f"📄 Parsing: {file_path}")
-                result = converter.convert(file_path)
-                doc = result.document
-                
-                # Get Metadata
-                base_meta = self._get_file_metadata(file_path)
-                
-                # Verify we have text
-                if not doc.export_to_markdown().strip():
-                    print(f"⚠️  Warning: No text found in {os.path.basename(file_path)}")
-                    continue
-                
-                # Chunking
-                chunk_iter = chunker.chunk(dl_doc=doc)
-                
-                file_chunk_count = 0
-                for chunk in chunk_iter:
-                    combined_meta = base_meta.copy()
-                    if chunk.meta: combined_meta.update(chunk.meta)
-                    
-                    sanitized_meta = {}
-                    for k, v in combined_meta.items():
-                        if isinstance(v, (str, int, float, bool)):
-                            sanitized_meta[k] = v
-                        else:
-                            sanitized_meta[k] = str(v)
-
-                    text_content = chunker.contextualize(chunk=chunk)
-                    all_chunks_for_db.append(Document(page_content=text_content, metadata=sanitized_meta))
-                    file_chunk_count += 1
-                
-                print(f"   -> {file_chunk_count} chunks.")
-
-            except Exception as e:
-                print(f"❌ Error processing {file_path}: {e}")
-
-        if not all_chunks_for_db: return
-
-        # 3. Add to ChromaDB in Batches
-        print(f"💾 Adding {len(all_chunks_for_db)} chunks to ChromaDB...")
-        batch_size = 10
-        for i in range(0, len(all_chunks_for_db), batch_size):
-            batch = all_chunks_for_db[i:i + batch_size]
-            self.vector_db.add_documents(batch)
-            print(f"   Processed batch {i // batch_size + 1}...")
-
-        print("✅ Ingestion Complete.")
+        # 1. Deleted files: drop their chunks
+        removed = [rel for rel in manifest if rel not in current]
+        for rel_path in removed:
+            self._delete_file_chunks(manifest, rel_path)
+        if removed:
+            self._save_manifest(manifest)
+
+        # 2. New or changed files (by content hash)
+        hashes = {rel: _file_hash(path) for rel, path in current.items()}
+        # A new chunker / embedding config re-chunks everything, from the parsed-document cache
+        pending = [
+            rel for rel in current
+            if manifest.get(rel, {}).get("sha256") != hashes[rel]
+            or manifest[rel].get("config") != self.chunking_config
+        ]
+        summary = {
+            "unchanged": len(current) - len(pending),
+            "new": sum(rel not in manifest for rel in pending),
+            "changed": sum(rel in manifest for rel in pending),
+            "removed": len(removed),
+            "chunks_added": 0,
+            "failed": []
+        }
+        print(f"🔍 Found {len(current)} files: {summary['unchanged']} unchanged, "
+              f"{summary['new']} new, {summary['changed']} changed, {summary['removed']} removed.")
+
+        if not pending:
+            print("✅ Ingestion Complete (nothing to do).")
+            return summary
+
+        # 3. Convert + chunk in worker processes
+        workers = max_workers or min(len(pending), os.cpu_count() or 1)
+        print(f"🔧 Parsing {len(pending)} files with Docling on {workers} worker processes...")
+        parsed = {}
+        # spawn: the parent already holds the embedding model, which is not fork-safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(_parse_file, current[rel], self._get_file_metadata(current[rel]),
+                            hashes[rel], self.parsed_cache_dir): rel
+                for rel in pending
+            }
+            for future in as_completed(futures):
+                rel_path = futures[future]
+                try:
+                    parsed[rel_path] = future.result()
+                    print(f"📄 {rel_path} -> {len(parsed[rel_path])} chunks.")
+                except Exception as e:
+                    print(f"❌ Error processing {rel_path}: {e}")
+                    summary["failed"].append(rel_path)
+
+        # 4. Embed all chunks in large batches and upsert them under deterministic ids
+        ids, texts, metadatas = [], [], []
+        for rel_path, chunks in parsed.items():
+            for position, (text_content, metadata) in enumerate(chunks):
+                metadata["source_path"] = rel_path
+                ids.append(_chunk_id(rel_path, position))
+                texts.append(text_content)
+                metadatas.append(metadata)
+
+        seconds = self._upsert_chunks(ids, texts, metadatas)
+        self.invalidate_query_caches()
+        summary["chunks_added"] = len(ids)
+        summary["chunks_per_second"] = round(len(ids) / seconds, 1) if seconds else None
+
+        # 5. Drop chunks a changed file no longer has, then record the new versions
+        for rel_path, chunks in parsed.items():
+            new_ids = [_chunk_id(rel_path, position) for position in range(len(chunks))]
+            stale = set(manifest.get(rel_path, {}).get("ids", [])) - set(new_ids)
+            if stale:
+                self.vector_db.delete(ids=list(stale))
+            manifest[rel_path] = {
+                "sha256": hashes[rel_path],
+                "config": self.chunking_config,
+                "chunks": len(new_ids),
+                "ids": new_ids
+            }
+        self._save_manifest(manifest)
+
+        print(f"✅ Ingestion Complete. Upserted {len(ids)} chunks ({summary['chunks_per_second']} chunks/s).")
+        return summary
+
+    def _upsert_chunks(self, ids: List[str], texts: List[str], metadatas: List[Dict]) -> float:
+        """
+        Embeds chunks UPSERT_BATCH_SIZE at a time (the model batches internally) and
+        writes each batch with one Chroma upsert. Returns the seconds spent.
+        """
+        start = time.perf_counter()
+        for i in range(0, len(ids), UPSERT_BATCH_SIZE):
+            batch = slice(i, i + UPSERT_BATCH_SIZE)
+            embeddings = self.embedding_function.embed_documents(texts[batch])
+            self.vector_db._collection.upsert(
+                ids=ids[batch], embeddings=embeddings, documents=texts[batch], metadatas=metadatas[batch]
+            )
+            print(f"   Upserted {min(i + UPSERT_BATCH_SIZE, len(ids))}/{len(ids)} chunks...")
+        return time.perf_counter() - start
+
+    def invalidate_query_caches(self):
+        """Called whenever the index changes: cached retrievals may now be stale."""
+        self.query_embedding_cache.clear()
+        self.retrieval_cache.clear()
+
+    def cache_stats(self) -> Dict:
+        return {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "retrievals": self.retrieval_cache.stats()
+        }
+
+    def _embed_queries(self, query_texts: List[str]) -> List[List[float]]:
+        """
+        Embeddings for several query texts; cache misses share one embed_documents call.
+        (HuggingFace and Ollama embeddings encode queries and documents identically.)
+        """
+        embeddings = {text: self.query_embedding_cache.get(text) for text in dict.fromkeys(query_texts)}
+        missing = [text for text, embedding in embeddings.items() if embedding is None]
+        if missing:
+            for text, embedding in zip(missing, self.embedding_function.embed_documents(missing)):
+                self.query_embedding_cache.put(text, embedding)
+                embeddings[text] = embedding
+        return [embeddings[text] for text in query_texts]
 
     def query(self, query_text: str, k: int = 4, filters: Optional[Dict] = None) -> str:
         """
         Queries self.vector_db and returns formatted string context.
+        Repeated (query, k, filters) combinations are served from the retrieval cache.
         """
         # print(f"🔍 Semantic Search: '{query_text}' | Filters: {filters}")
-        
-        search_kwargs = {"k": k}
-        if filters:
-            search_kwargs["filter"] = filters        
-        retriever = self.vector_db.as_retriever(search_kwargs=search_kwargs)
-        docs = retriever.invoke(query_text)
-        # docs = self.vector_db.similarity_search(query_text, k, filter=filters)
-
-        if not docs:
-            return "No relevant documents found in knowledge base."
-
-        formatted_context = ""
-        for doc in docs:
-            source = doc.metadata.get("source", "unknown")
-            category = doc.metadata.get("category", "general")
-            formatted_context += f"\n[Source: {source} | Type: {category}]\n{doc.page_content}\n"
-            
-        return formatted_context
+        return self.query_many([{"query": query_text, "k": k, "filters": filters}])[0]
+
+    def query_many(self, queries: List[Dict]) -> List[str]:
+        """
+        Batched form of query(): each item is {"query", "k" (default 4), "filters" (optional)}.
+        Returns one formatted context per item, in order.
+        """
+        return [format_context(chunks) for chunks in self.retrieve_many(queries)]
+
+    def retrieve_many(self, queries: List[Dict]) -> List[List[Dict]]:
+        """
+        Structured form of query_many(): one list of chunks per item, best first, each
+        {"id", "text", "source", "category", "distance"}.
+
+        Cached results are returned as-is; the remaining query texts are embedded in a
+        single forward pass and searched with one Chroma call per distinct (k, filters).
+        """
+        keys = []
+        for item in queries:
+            filters = item.get("filters")
+            keys.append((item["query"], item.get("k", 4), json.dumps(filters, sort_keys=True) if filters else None))
+
+        results = [self.retrieval_cache.get(key) for key in keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        embeddings = self._embed_queries([keys[i][0] for i in pending])
+        groups = {}
+        for i, embedding in zip(pending, embeddings):
+            groups.setdefault(keys[i][1:], []).append((i, embedding))
+
+        # Same search similarity_search_by_vector runs, for all queries of a group at once
+        for (k, filters_key), members in groups.items():
+            found = self.vector_db._collection.query(
+                query_embeddings=[embedding for _, embedding in members],
+                n_results=k,
+                where=json.loads(filters_key) if filters_key else None
+            )
+            for (i, _), ids, texts, metadatas, distances in zip(
+                members, found["ids"], found["documents"], found["metadatas"], found["distances"]
+            ):
+                results[i] = [
+                    {
+                        "id": chunk_id,
+                        "text": text,
+                        "source": (metadata or {}).get("source", "unknown"),
+                        "category": (metadata or {}).get("category", "general"),
+                        "distance": float(distance)
+                    }
+                    for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+                ]
+                self.retrieval_cache.put(keys[i], results[i])
+        return results
 
 if __name__ == "__main__":
     print("="*60)
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "./report_cache")
+CHARS_PER_TOKEN = 4  # rough estimate when the provider reports no token usage
+
+def model_id(llm) -> str:
+    """Provider class and model name, e.g. 'ChatGroq:llama-3.3-70b-versatile'."""
+    name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or "unknown"
+    return f"{type(llm).__name__}:{name}"
+
+def estimate_tokens(*texts: str) -> int:
+    return sum(len(text or "") for text in texts) // CHARS_PER_TOKEN
+
+def usage_tokens(message, *prompt_texts: str) -> int:
+    """Total tokens of an LLM call: the provider's usage metadata when present, else an estimate."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    return estimate_tokens(*prompt_texts, getattr(message, "content", ""))
+
+class ReportCache:
+    """
+    Persistent cache of audit reports, one JSON file per key.
+
+    The audit LLM calls run at temperature 0, so a report is reusable as long as the
+    prompt template, model, plan and gathered evidence are all unchanged; the key is a
+    hash of exactly those. Hit/miss counts and tokens saved are kept per process.
+    """
+
+    def __init__(self, cache_dir: str = REPORT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(template: str, model: str, plan: dict, evidence) -> str:
+        digest = hashlib.sha256()
+        for part in (template, model, json.dumps(plan, sort_keys=True), json.dumps(evidence, sort_keys=True)):
+            # Length-prefixed so that parts cannot run into each other
+            encoded = part.encode("utf-8")
+            digest.update(f"{len(encoded)}:".encode())
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """The cached report payload, or None."""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += entry.get("tokens", 0)
+        return entry["report"]
+
+    def put(self, key: str, report, model: str, tokens: int):
+        entry = {"report": report, "model": model, "tokens": tokens, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "tokens_saved": self.tokens_saved
+            }
+
+# Shared by the sequential audit, the analysis agent and the API
+report_cache = ReportCache()
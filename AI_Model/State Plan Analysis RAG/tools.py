@@ -1,6 +1,12 @@
+import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from langchain_core.tools import tool
 from rag_system import PMAjayRAG
+from financial_engine import evaluate_plans, format_compliance_report, NON_AMOUNT
+
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))  # per evidence check
 
 # --- SINGLETON RAG INSTANCE ---
 # This initializes the class defined in rag_system.py
@@ -16,10 +22,8 @@ rag_engine = PMAjayRAG(
 def parse_currency(value_str):
     """Utility to clean currency strings."""
     if not isinstance(value_str, str): return 0
-    # Clean non-ascii (like rupee symbol if it's garbled)
-    clean_str = value_str.encode('ascii', 'ignore').decode('utf-8')
-    # Use simple numeric extraction
-    clean_str = ''.join(c for c in clean_str if c.isdigit() or c == '.')
+    # Keep ASCII digits and '.' only (drops the rupee symbol, commas and anything non-ascii)
+    clean_str = NON_AMOUNT.sub('', value_str)
     # clean_str = value_str.replace('₹', '').replace(',', '').strip()
     return int(float(clean_str)) if clean_str else 0
 
@@ -36,80 +40,51 @@ def check_financial_compliance(plan_json_str: str) -> str:
     """
     try:
         data = json.loads(plan_json_str)
-        
-        skill_total = 0
-        infra_total = 0
-        income_total = 0
-        admin_total = 0
-        
-        # 1. Skill Costs
-        if data.get("skillDevelopment", {}).get("isActive"):
-            years = data["skillDevelopment"].get("sectionByYear", {})
-            for _, details in years.items():
-                for beneficiary in details.get("beneficiaryBreakup", []):
-                    skill_total += parse_currency(beneficiary.get("fundsProposedGrantInAid", "0"))
-
-        # 2. Infrastructure Costs
-        if data.get("infrastructureDevelopment", {}).get("isActive"):
-            years = data["infrastructureDevelopment"].get("sectionByYear", {})
-            for _, details in years.items():
-                funds = details.get("otherSchemeFunds", {})
-                infra_total += parse_currency(funds.get("fundsFromGrantInAid", "0"))
-
-        # 3. Admin Costs
-        admin_section = data.get("adminCosts", {})
-        for _, details in admin_section.items():
-            admin_total += parse_currency(details.get("adminExpenseAmount", "0"))
-
-        # 4. Income Gen (Grant Portion)
-        if data.get("incomeGeneration", {}).get("isActive"):
-             years = data["incomeGeneration"].get("sectionByYear", {})
-             for _, details in years.items():
-                 # Assuming beneficiaries * grant per beneficiary
-                 per_capita_grant = parse_currency(details.get("financials", {}).get("grantInAid", "0"))
-                 count = int(details.get("beneficiaries", 0))
-                 income_total += (per_capita_grant * count)
-
-        grand_total = skill_total + infra_total + income_total + admin_total
-        
-        if grand_total == 0:
-            return "Error: Total Project Cost is 0. Check JSON."
-
-        skill_pct = (skill_total / grand_total) * 100
-        infra_pct = (infra_total / grand_total) * 100
-        admin_pct = (admin_total / grand_total) * 100
-        
-        report = [f"Total Budget: ₹{grand_total}"]
-        
-        if skill_pct >= 10: report.append(f"✅ Skill Dev: {skill_pct:.2f}% (Pass)")
-        else: report.append(f"❌ Skill Dev: {skill_pct:.2f}% (Fail, needs >=10%)")
-            
-        if infra_pct <= 30: report.append(f"✅ Infrastructure: {infra_pct:.2f}% (Pass)")
-        else: report.append(f"❌ Infrastructure: {infra_pct:.2f}% (Fail, needs <=30%)")
-
-        if admin_pct <= 4: report.append(f"✅ Admin: {admin_pct:.2f}% (Pass)")
-        else: report.append(f"❌ Admin: {admin_pct:.2f}% (Fail, needs <=4%)")
-            
-        return "\n".join(report)
+        # Same engine as bulk checks (financial_engine.evaluate_plans), for a single plan
+        results, _ = evaluate_plans([data])
+        return format_compliance_report(results.iloc[0])
         
     except Exception as e:
         return f"Calculation Error: {str(e)}"
 
+# Retrieval requests behind the RAG tools, shared by the string tools and the structured evidence helpers
+def _vision_query(title: str) -> dict:
+    return {
+        "query": f'''
+        pm ajay guidelines
+        pm ajay project lists under various domains
+        is {title} valid under pm ajay
+        ''',
+        "filters": {"category": "rules"},
+        "k": 5
+    }
+
+def _overlap_query(project_description: str) -> dict:
+    return {
+        "query": f"schemes similar to {project_description} which are not part of PM AJAY Grant in Aid",
+        "k": 4
+    }
+
+def _precedent_query(project_type: str) -> dict:
+    return {
+        "query": f"implementation details and cost of {project_type}",
+        "filters": {"category": "precedent"}
+    }
+
 @tool
 def verify_vision_alignment(title: str) -> str:
     """
     Checks if an activity (e.g. 'Milk Chilling Center') is allowed under PM-AJAY Guidelines.
     Uses the RAG engine to search policy documents.
     """
-    return rag_engine.query(
-        query_text=f'''
-        pm ajay guidelines
-        pm ajay project lists under various domains
-        is {title} valid under pm ajay
-        ''',
-        filters={"category": "rules"},
-        k=5
-    )
+    return rag_engine.query_many([_vision_query(title)])[0]
+
+def verify_vision_alignment_many(titles: list) -> list:
+    """
+    verify_vision_alignment for several activities in one retrieval round-trip.
+    Returns one result per title, in order.
+    """
+    return rag_engine.query_many([_vision_query(title) for title in titles])
 
 @tool
 def check_scheme_overlap(project_description: str) -> str:
@@ -117,20 +92,86 @@ def check_scheme_overlap(project_description: str) -> str:
     Checks for duplication with other schemes (PM-DAKSH, NRLM, etc.).
     Searches the knowledge base for similar existing schemes.
     """
-    return rag_engine.query(
-        query_text=f"schemes similar to {project_description} which are not part of PM AJAY Grant in Aid",
-        k=4
-    )
+    return rag_engine.query_many([_overlap_query(project_description)])[0]
 
 @tool
 def check_state_precedents(project_type: str) -> str:
     """
     Searches previous approved State Plans for cost benchmarks and implementation details.
     """
-    return rag_engine.query(
-        query_text=f"implementation details and cost of {project_type}",
-        filters={"category": "precedent"}
-    )
+    return rag_engine.query_many([_precedent_query(project_type)])[0]
+
+# --- STRUCTURED EVIDENCE (chunks, for prompt assembly) ---
+
+def _merged_chunks(queries: list) -> list:
+    # One batched retrieval; results of all queries ranked together, closest first
+    chunks = [chunk for result in rag_engine.retrieve_many(queries) for chunk in result]
+    return sorted(chunks, key=lambda chunk: chunk["distance"])
+
+def vision_evidence(titles: list) -> list:
+    return _merged_chunks([_vision_query(title) for title in titles])
+
+def overlap_evidence(project_description: str) -> list:
+    return _merged_chunks([_overlap_query(project_description)])
+
+def precedent_evidence(project_type: str) -> list:
+    return _merged_chunks([_precedent_query(project_type)])
+
+# --- CONCURRENT EVIDENCE GATHERING ---
+
+def _timed_call(check):
+    start = time.perf_counter()
+    try:
+        output, status = check(), "ok"
+    except Exception as e:
+        output, status = f"Check failed: {str(e)}", "error"
+    return {"output": output, "seconds": round(time.perf_counter() - start, 3), "status": status}
+
+def gather_evidence(checks: dict, timeout=TOOL_TIMEOUT_SECONDS, on_result=None) -> dict:
+    """
+    Runs independent evidence checks concurrently.
+    checks: {name: zero-argument callable}; timeout: seconds for every check, or {name: seconds}.
+    Returns {name: {"output", "seconds", "status"}} in the order of `checks`, where status is
+    "ok", "error" or "timeout". A failed or timed-out check yields a short note as its output,
+    so the report can still be written from the remaining evidence.
+    `on_result(name, entry)` is called in the caller's thread as each check settles.
+    """
+    if not checks:
+        return {}
+    pool = ThreadPoolExecutor(max_workers=len(checks))
+    started = time.perf_counter()
+    pending = {pool.submit(_timed_call, check): name for name, check in checks.items()}
+    deadlines = {
+        name: started + (timeout.get(name, TOOL_TIMEOUT_SECONDS) if isinstance(timeout, dict) else timeout)
+        for name in checks
+    }
+
+    evidence = {}
+    def settle(future, entry):
+        name = pending.pop(future)
+        evidence[name] = entry
+        print(f"   ➤ {name}: {entry['status']} in {entry['seconds']}s")
+        if on_result:
+            on_result(name, entry)
+
+    while pending:
+        next_deadline = min(deadlines[name] for name in pending.values())
+        done, _ = wait(pending, timeout=max(0.0, next_deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+        for future in done:
+            settle(future, future.result())
+        now = time.perf_counter()
+        for future, name in list(pending.items()):
+            if deadlines[name] <= now:
+                settle(future, {"output": f"Check did not finish within {deadlines[name] - started:g}s.",
+                                "seconds": round(now - started, 3), "status": "timeout"})
+
+    # Timed-out checks keep running in their thread; don't hold the caller up for them
+    pool.shutdown(wait=False, cancel_futures=True)
+    return {name: evidence[name] for name in checks}
+
+def format_timings(evidence: dict) -> str:
+    """One line per check, e.g. '- overlap: 0.412s (ok)'."""
+    return "\n".join(f"- {name}: {entry['seconds']}s ({entry['status']})" for name, entry in evidence.items())
 
 # List of tools to export to main.py
 pmajay_tools = [